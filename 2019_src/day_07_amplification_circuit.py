@@ -39,9 +39,11 @@ What is the combination of phase settings that gives max output
 
 '''
 
+import concurrent.futures
 import itertools
-import threading
 import logging
+import os
+import sys
 
 import int_code_computer as icc
 
@@ -50,6 +52,10 @@ LOGGER = logging.getLogger(__name__)
 PHASE_VALUES_1 = [0, 1, 2, 3, 4]
 PHASE_VALUES_2 = [5, 6, 7, 8, 9]
 
+# Permutations sent to a search worker in one go and the chunks in flight per worker
+SEARCH_CHUNK_SIZE = 60
+SEARCH_IN_FLIGHT = 4
+
 # Permutations can be generated using Heap's Algorithm (see wikipedia) but luckily Python
 # does this for us...
 
@@ -62,94 +68,188 @@ def run_permutation(program, phase_values):
     """
     next_input_data = 0
 
-    for i in range(0, 5):
-        computer = icc.IntCodeComputer(program, [phase_values[i], next_input_data])
-        computer.run_program()
-        next_input_data = computer.result[-1]
+    # Each amp output only depends on (phase, input) so many stages are repeats
+    for phase in phase_values:
+        next_input_data = icc.cached_run(program, [phase, next_input_data])[-1]
 
     return next_input_data
-def find_max_output():
+
+def search_chain(program, phase_values, cache=None):
+    """ Find the max output of the linear chain by walking the permutation tree
+        depth first.  Permutations with the same prefix share the runs for it and
+        each amp run is cached on (phase, input signal) so we only run each one once.
+
+        cache = optional dict to use for the stage cache (len(cache) is the
+        number of amp runs we did)
+
+        Returns (max output, phase settings)
+    """
+    if cache is None:
+        cache = {}
+    best = (None, None)
+
+    def walk(prefix, remaining, signal):
+        nonlocal best
+        if not remaining:
+            if best[0] is None or signal > best[0]:
+                best = (signal, prefix)
+            return
+
+        for i, phase in enumerate(remaining):
+            # Same phase value twice in the set gives the same sub-tree
+            if phase in remaining[:i]:
+                continue
+            key = (phase, signal)
+            if key not in cache:
+                cache[key] = icc.run_computer(program, [phase, signal])[-1]
+            walk(prefix + (phase,), remaining[:i] + remaining[i + 1:], cache[key])
+
+    walk((), tuple(phase_values), 0)
+    return best
+
+def search_chunk(feedback, permutations):
+    """ Return (max output, phase settings) for a list of permutations.  The
+        program comes from icc.init_batch_worker().
+    """
+    best = None
+    for phase_settings in permutations:
+        if feedback:
+            output = run_feedback_loop(icc.WORKER_PROGRAM, phase_settings)[-1]
+        else:
+            output = run_permutation(icc.WORKER_PROGRAM, phase_settings)
+        if best is None or output > best[0]:
+            best = (output, phase_settings)
+    return best
+
+def search_permutations(program, phase_values, feedback=False, max_workers=None,
+                        pool_class=concurrent.futures.ProcessPoolExecutor):
+    """ Try every permutation of phase_values on a pool of processes.  The
+        program is sent to each worker once.  Works for any number of amps.
+
+        Yields (output, phase settings) each time we find a new max so the caller
+        can stop early.  Permutations are made as they are needed and only a few
+        chunks are in flight at a time so big phase sets do not fill memory.
+        Chunks that have not started when the caller stops are cancelled.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    permutations = itertools.permutations(phase_values)
+    best = None
+    with pool_class(max_workers=max_workers, initializer=icc.init_batch_worker,
+                    initargs=(list(program), icc.DictMemory)) as pool:
+        pending = set()
+        try:
+            while True:
+                while len(pending) < SEARCH_IN_FLIGHT * max_workers:
+                    chunk = list(itertools.islice(permutations, SEARCH_CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    pending.add(pool.submit(search_chunk, feedback, chunk))
+
+                if not pending:
+                    break
+
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    output, phase_settings = future.result()
+                    if best is None or output > best[0]:
+                        best = (output, phase_settings)
+                        yield best
+        finally:
+            # Stopped early.  Drop the work that has not started.
+            for future in pending:
+                future.cancel()
+
+def find_max_output(program):
     """ Find the maximum amplifier output  for all the given phase settings
 
         Max Output = 262086, Max Phase Settings = (2, 1, 4, 0, 3)
     """
-    program = icc.load_data("day_07_data.txt")
-
-    max_output = 0
-    max_phase = None
-    for phase_settings in PHASE_VALUE_PERMUTATIONS_1:
-        output = run_permutation(program, phase_settings)
-        if output > max_output:
-            max_output = output
-            max_phase = phase_settings
-        #print(f"Phase settings={phase_settings}, Output={output}")
+    cache = {}
+    max_output, max_phase = search_chain(program, PHASE_VALUES_1, cache)
+    LOGGER.debug('Amp runs %s', len(cache))
 
     print('Part 1:')
     print(f"Max Output = {max_output}, Max Phase Settings = {max_phase}")
 
-def run_feedback_loop(phase_settings):
-    """ Modify the computer to use Queues for inputs and outputs.
-        Computer will block if input required and input Queue is empty.
+def run_feedback_loop(program, phase_settings):
+    """ Run the amps in a feedback loop.  The outputs of each amp go to the input
+        of the next one and the last amp feeds the first.
 
-        Will run each computer in a separate thread so they can run
-        simultaneously.
+        The amps run round robin on one thread (icc.Network) and each one gets a
+        turn when the amp before it has output something.
     """
-    program = icc.load_data("day_7_data.txt")
-
-    thread_pool = []
-    thread_pool_size = 5
-
-    # Setup pool of amp int code computers with feedback configuration
-    amp_pool = []
-    amp_pool.append(icc.IntCodeComputer(program))
-    amp_pool.append(icc.IntCodeComputer(program, amp_pool[0].output))
-    amp_pool.append(icc.IntCodeComputer(program, amp_pool[1].output))
-    amp_pool.append(icc.IntCodeComputer(program, amp_pool[2].output))
-    amp_pool.append(icc.IntCodeComputer(program, amp_pool[3].output, amp_pool[0].input))
-
-
-    # Pre-load all the pahse settings
-    for i in range(thread_pool_size):
-        amp_pool[i].input.put(phase_settings[i])
+    # Pre-load all the phase settings
+    amp_pool = [icc.IntCodeComputer(program, [phase]) for phase in phase_settings]
 
     # Give Amp 0 the starting input value of 0
-    amp_pool[0].input.put(0)
-
-    for i in range(thread_pool_size):
-        # Setup a worker thread for each amp and insert the phase settings
-        # input each of the input queues.
-        worker_thread = threading.Thread(target=amp_pool[i].run_program)
-
-        # Deamonise the threads (so the die nicely when the script ends
-        # May not be needed but stops stray threads being left behind if
-        # we have a crash or some other weird exit.
-        worker_thread.daemon = True
+    amp_pool[0].send(0)
 
-        # Start each of the threads running
-        worker_thread.start()
+    icc.Network.ring(amp_pool).run()
 
-        # Add them to pool list so we can keep track of them
-        thread_pool.append(worker_thread)
+    return amp_pool[-1].result
 
-    # Wait here for all the threads to exit properly
-    for thd in thread_pool:
-        thd.join()
-
-    return amp_pool[4].result
-def find_max_feedback_output():
+def find_max_feedback_output(program):
     """ Find max amplifier output with feedback """
     max_output = 0
     max_phase_settings = None
-    for phase_settings in PHASE_VALUE_PERMUTATIONS_2:
-        result = run_feedback_loop(phase_settings)
-        if result[-1] > max_output:
-            max_output = result[-1]
-            max_phase_settings = phase_settings
+    for max_output, max_phase_settings in search_permutations(program, PHASE_VALUES_2,
+                                                              feedback=True):
+        LOGGER.debug('Best so far %s %s', max_output, max_phase_settings)
 
     print('\nPart 2:')
     print(f'Max Feedback Output = {max_output}, Max Feedback Phase Settings = {max_phase_settings}')
 
+def run_tests(program):
+    """ Check the searches against simple scans.
+        Run with: python day_07_amplification_circuit.py test
+    """
+
+    # Chain search matches trying every permutation in turn with far fewer amp
+    # runs than the 5 * 120 a full scan does
+    cache = {}
+    max_output, max_phase = search_chain(program, PHASE_VALUES_1, cache)
+    assert len(cache) < 330
+    assert max_output == max(run_permutation(program, phases)
+                             for phases in PHASE_VALUE_PERMUTATIONS_1)
+    assert run_permutation(program, max_phase) == max_output
+
+    # Six amps (phase 0 twice).  The pool search agrees with the chain search.
+    phase_values = PHASE_VALUES_1 + [0]
+    results = list(search_permutations(program, phase_values, max_workers=2))
+    assert [output for output, _ in results] == sorted(output for output, _ in results)
+    assert results[-1][0] == search_chain(program, phase_values)[0]
+    assert run_permutation(program, results[-1][1]) == results[-1][0]
+
+    # Stop after the first result.  Chunks that had not started are cancelled.
+    futures = []
+
+    class RecordingPool(concurrent.futures.ProcessPoolExecutor):
+        """ Process pool that keeps every future it hands out """
+        def submit(self, *args, **kwargs): # pylint: disable=arguments-differ
+            future = super().submit(*args, **kwargs)
+            futures.append(future)
+            return future
+
+    phase_values = PHASE_VALUES_2 + [5, 6]
+    search = search_permutations(program, phase_values, feedback=True, max_workers=2,
+                                 pool_class=RecordingPool)
+    next(search)
+    search.close()
+    chunks = -(-len(list(itertools.permutations(phase_values))) // SEARCH_CHUNK_SIZE)
+    assert len(futures) < chunks
+    assert all(future.done() for future in futures)
+    assert any(future.cancelled() for future in futures)
+
+    LOGGER.info('Day 7: all tests pass')
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    find_max_output()
-    find_max_feedback_output()
+    PROGRAM = icc.load_data("day_07_data.txt")
+    if sys.argv[1:] == ['test']:
+        run_tests(PROGRAM)
+    else:
+        find_max_output(PROGRAM)
+        find_max_feedback_output(PROGRAM)
@@ -27,11 +27,11 @@ def main():
 
     print("Part 1: Boost keycode:")
     input_data = [1]
-    print(icc.run_computer(program, input_data))
+    print(icc.run_computer(program, input_data, compiled=True))
 
     print("\nPart 2: Distress signal co-ords:")
     input_data = [2]
-    print(icc.run_computer(program, input_data))
+    print(icc.run_computer(program, input_data, compiled=True))
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -17,7 +17,6 @@ Need to remove duplicates (do not count spaces painted twice)
 
 
 '''
-import threading
 import logging
 import int_code_computer as icc
 
@@ -69,7 +68,7 @@ def print_sign(painted):
             print(char, end='')
         print()
 
-def paint_sign(program):
+def paint_sign(program, comp=None):
     """ Run the intCode computer with the given painting program
         Give 0 as initial input then paint, move and give next input.
         Next imput is the colour we have painted the square or if
@@ -78,6 +77,8 @@ def paint_sign(program):
         0 = Black
         1 = White
 
+        comp = computer to use.  Built from program if not given.
+
     """
     # Dict with keys of tuples for painted squares
     # Values = colour of paint
@@ -85,27 +86,29 @@ def paint_sign(program):
     initial_colour = 1
     painted = {(0,0):1}
 
-    # Start a thread here to run the computer
-    comp = icc.IntCodeComputer(program, [initial_colour])
-    comp_thread = threading.Thread(target=comp.run_program)
-    comp_thread.daemon = True
-    comp_thread.start()
+    # Run the computer in this thread until it asks for the next input
+    if comp is None:
+        comp = icc.IntCodeComputer(program, [initial_colour], output_sink=icc.OUTPUT_QUEUE)
 
-    # Setup initial position
+    # Setup initial position
     coords = (0, 0)
     heading = 0
 
-    while not comp.halt_status:
-        # Get paint colour
-        paint_colour = comp.output.get()
-        turn_direction = comp.output.get()
-        #print(f"Paint= {paint_colour}, Turn= {turn_direction}")
+    status = None
+    while status != icc.HALTED:
+        status = comp.run_until_input()
+
+        while not comp.output.empty():
+            # Get paint colour
+            paint_colour = comp.output.get()
+            turn_direction = comp.output.get()
+            #print(f"Paint= {paint_colour}, Turn= {turn_direction}")
 
-        # Paint the square (overwrites any existing paint in the square)
-        painted[coords] = paint_colour
+            # Paint the square (overwrites any existing paint in the square)
+            painted[coords] = paint_colour
 
-        # Execute instructed move
-        coords, heading = turn_move(turn_direction, coords, heading)
+            # Execute instructed move
+            coords, heading = turn_move(turn_direction, coords, heading)
 
         # Get input for new square
         inp = painted.get(coords, 0)
@@ -7,8 +7,6 @@ Advent of Code 2019 - Day 13: Care Package
 
 '''
 import logging
-import threading
-import time
 import int_code_computer as icc
 
 X_COLS = 37
@@ -20,9 +18,6 @@ LOGGER = logging.getLogger(__name__)
 def update_grid(comp, grid):
     """ The 2-D array grid with the screen data
     """
-    while not comp.waiting and not comp.halt_status:
-        time.sleep(0.001)
-
     while not comp.output.empty():
         # Get 3 results
         x = comp.output.get()
@@ -77,7 +72,7 @@ def part_1():
     """
 
     program = icc.load_data('day_13_data.txt')
-    comp = icc.IntCodeComputer(program)
+    comp = icc.IntCodeComputer(program, compiled=True, output_sink=icc.OUTPUT_QUEUE)
     comp.run_program()
 
     # Build an empty grid
@@ -96,41 +91,38 @@ def part_2():
     # 2 = Free play
     program[0] = 2
 
-    # Start a thread here to run the computer
-    comp = icc.IntCodeComputer(program)
-    comp_thread = threading.Thread(target=comp.run_program)
-    comp_thread.daemon = True
-    comp_thread.start()
+    # Computer runs in this thread until it wants the next joystick input
+    comp = icc.IntCodeComputer(program, compiled=True, output_sink=icc.OUTPUT_QUEUE)
 
     # Build an empty grid
     grid = [['' for _ in range(24)] for _ in range(37)]
 
     # Run the computer and cature the next grid iteration
     # Apply an input to move the paddle for the next step.
+    comp.run_until_input()
     update_grid(comp, grid)
     last_ball_x = find_ball(grid)
     print_grid(grid)
-    comp.input.put(-1)
-
-    while not comp.halt_status:
-        if not comp.output.empty():
-            update_grid(comp, grid)
-            print_grid(grid)
-            ball_x = find_ball(grid)
-
-            paddle_x = find_paddle(grid)
-            moves = abs(paddle_x - ball_x)
-            if moves != 0:
-                for _ in range(moves):
-                    if ball_x > last_ball_x:
-                        comp.input.put(1)
-                    else:
-                        comp.input.put(-1)
+    comp.send(-1)
+
+    while comp.run_until_input() != icc.HALTED:
+        update_grid(comp, grid)
+        print_grid(grid)
+        ball_x = find_ball(grid)
+
+        paddle_x = find_paddle(grid)
+        moves = abs(paddle_x - ball_x)
+        if moves != 0:
+            if ball_x > last_ball_x:
+                comp.send(*[1] * moves)
             else:
-                comp.input.put(0)
+                comp.send(*[-1] * moves)
+        else:
+            comp.send(0)
 
-            last_ball_x = ball_x
+        last_ball_x = ball_x
 
+    update_grid(comp, grid)
     print("GAME OVER")
 
 def main():
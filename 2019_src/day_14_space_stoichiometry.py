@@ -94,9 +94,12 @@ def make_product(qty, prod, recipes, counts):
     # After making the product increase our count of that product
     counts[prod] += recipes[prod][1][0][0] * runs
 
-def calculate_ore_for_x_fuel(fuel_qty):
-    """ Calculate ORE required for x batches of fuel """
-    recipes, counts = load_file('day_14.txt')
+def calculate_ore_for_x_fuel(fuel_qty, recipes):
+    """ Calculate ORE required for x batches of fuel.
+        recipes come from load_file() so we only parse the file once.
+    """
+    counts = dict.fromkeys(recipes, 0)
+    counts['ORE'] = 0
     make_product(fuel_qty, 'FUEL', recipes, counts)
     LOGGER.debug(counts)
     return -counts['ORE']
@@ -134,13 +137,16 @@ def binary_search(my_func, wanted, lower, upper):
 def main():
     """ Main Program """
 
+    recipes, _ = load_file('day_14.txt')
+
     # Part 1
-    ore = calculate_ore_for_x_fuel(1)
+    ore = calculate_ore_for_x_fuel(1, recipes)
     print(f"Part 1: Ore for one unit of fuel = {ore}")
 
     # Calculate how much Fuel we get for a trillion tons of ORE
     wanted = 1000000000000
-    fuel = binary_search(calculate_ore_for_x_fuel, wanted, 1, 100)
+    fuel = binary_search(lambda fuel_qty: calculate_ore_for_x_fuel(fuel_qty, recipes),
+                         wanted, 1, 100)
     print(f"Part 2: Binary Search for fuel output given 1Trillion tons of ore.  Fuel = {fuel}")
 
 if __name__ == "__main__":
@@ -8,8 +8,6 @@ Adevent of Code 2019 - Day 15: Oxygen System
 '''
 import logging
 import sys
-import threading
-import time
 import int_code_computer as icc
 
 
@@ -72,18 +70,17 @@ def update_maze(maze, direction, output, d_posn):
         d_posn = (d_posn[0] + x_delta, d_posn[1] + y_delta)
 
     return d_posn
-def build_maze():
+def build_maze(comp=None):
     # pylint: disable=too-many-branches
-    """ Run the maze and print out the walls
+    """ Run the maze and print out the walls.
+        comp = droid computer to use.  Built from day_15.txt if not given.
     """
 
-    program = icc.load_data("day_15.txt")
+    if comp is None:
+        program = icc.load_data("day_15.txt")
 
-    # Start a thread here to run the computer
-    comp = icc.IntCodeComputer(program)
-    comp_thread = threading.Thread(target=comp.run_program)
-    comp_thread.daemon = True
-    comp_thread.start()
+        # The computer runs in this thread between moves
+        comp = icc.IntCodeComputer(program, output_sink=icc.OUTPUT_QUEUE)
 
     maze = {}
     d_posn = INITIAL_POSN
@@ -92,11 +89,10 @@ def build_maze():
     all_done = False
 
     # Make the first move
-    comp.input.put(direction)
-    while not comp.waiting:
-        time.sleep(0.1)
+    comp.send(direction)
 
     while not all_done:
+        comp.run_until_input()
 
         while not comp.output.empty():
             out = comp.output.get()
@@ -124,7 +120,7 @@ def build_maze():
             elif out == 2:
                 s_found = True
 
-            comp.input.put(direction)
+            comp.send(direction)
 
         if s_found is True and d_posn == INITIAL_POSN:
             all_done = True
@@ -6,7 +6,6 @@ Created on 17 Dec 2019
 Advent of Code 2019 - Day 17: Set and Forget
 
 '''
-import threading
 import logging
 import int_code_computer as icc
 
@@ -15,16 +14,15 @@ LOGGER = logging.getLogger(__name__)
 MAX_X = 55 # 0-54
 MAX_Y = 53 # 0-52
 
-def build_maze(maze_data):
+def build_maze(frame):
     # pylint: disable=invalid-name
-    """ Build a 2d matrix for the maze """
+    """ Build a 2d matrix for the maze from the camera frame (list of lines) """
 
-    maze_data = [chr(val) for val in maze_data if val != 10]
     maze = [['W' for _ in range(MAX_Y)] for _ in range(MAX_X)]
 
-    for i, val in enumerate(maze_data):
-        y, x = divmod(i, MAX_X)
-        maze[x][y] = val
+    for y, line in enumerate(frame):
+        for x, val in enumerate(line):
+            maze[x][y] = val
 
     return maze
 def find_crossings(maze):
@@ -56,34 +54,20 @@ def print_maze(maze):
             print(maze[x][y], end='')
         print()
 def build_movement_function(m_str):
-    """ Build the movement function in ASCII from the
+    """ Build the movement function line from the
         given string of the form:
 
-        'L10, L8, R8, L8, R6'
+        'L10, L8, R8, L8, R6' -> 'L,10,L,8,R,8,L,8,R,6\n'
     """
     m_str = [chars.strip() for chars in m_str.split(',')]
 
-    func = []
-    for chars in m_str:
-        turn = ord(chars[0])
-        func += [turn, ord(',')]
-
-        for char in list(chars[1:]):
-            func += [ord(char)]
-        func += [ord(',')]
-
-    func[-1] = ord('\n')
-
-    return func
+    return ','.join(f'{chars[0]},{chars[1:]}' for chars in m_str) + '\n'
 def build_instructions():
     """ Build the move instructions """
 
     mmr = ['A', 'A', 'B', 'C', 'B', 'C', 'B', 'C', 'B', 'A']
 
-    func_mmr = []
-    for char in mmr:
-        func_mmr += [ord(char), ord(',')]
-    func_mmr[-1] = ord('\n')
+    func_mmr = ','.join(mmr) + '\n'
 
     #a_str = 'L10, L8, R8, L8, R6'
     #b_str = 'R6, R6, L8, L10, R6'
@@ -97,10 +81,10 @@ def build_instructions():
     func_b = build_movement_function(b_str)
     func_c = build_movement_function(c_str)
 
-    print(func_mmr)
-    print(func_a, len(func_a))
-    print(func_b, len(func_b))
-    print(func_c, len(func_c))
+    print(func_mmr, end='')
+    print(func_a, end='')
+    print(func_b, end='')
+    print(func_c, end='')
 
     return func_mmr + func_a + func_b + func_c
 
@@ -108,14 +92,10 @@ def main():
     """ Main Program """
     print('Part 1:')
     program = icc.load_data('day_17_data.txt')
-    comp = icc.IntCodeComputer(program)
+    comp = icc.IntCodeComputer(program, output_sink=icc.OUTPUT_QUEUE)
     comp.run_program()
 
-    maze_raw = []
-    while not comp.output.empty():
-        maze_raw.append(comp.output.get())
-
-    maze = build_maze(maze_raw)
+    maze = build_maze(comp.read_ascii().frames()[0])
     crossings = find_crossings(maze)
     print_maze(maze)
     print(f"\nAlignment sum = {sum_alignments(crossings)}")
@@ -123,29 +103,18 @@ def main():
     print('\nPart 2:')
     program = icc.load_data('day_17_data.txt')
     program[0] = 2 # Wake up the robot
-    comp = icc.IntCodeComputer(program)
-
-    # Load the movement instructions
-    for ins in build_instructions():
-        comp.input.put(ins)
-
-    # Load the y/n for video feed
-    comp.input.put(ord('n'))
-    comp.input.put(ord('\n'))
-
-    comp_thread = threading.Thread(target=comp.run_program)
-    comp_thread.daemon = True
-    comp_thread.start()
-
-    output = []
-    while True:
-        out = comp.output.get()
-        output.append(out)
-        try:
-            print(chr(out), end='')
-        except ValueError:
-            print(out)
-            break
+    comp = icc.IntCodeComputer(program, output_sink=icc.OUTPUT_QUEUE)
+
+    # Load the movement instructions and the y/n for video feed
+    comp.send_ascii(build_instructions() + 'n\n')
+
+    # All the input is loaded up front so just run it to the end
+    comp.run_program()
+
+    # Prompts from the robot then the dust count
+    output = comp.read_ascii()
+    print(output.text, end='')
+    print(output.values[-1])
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -10,6 +10,7 @@ Advent of Code 2019 - Day 19: Tractor Beam
 import logging
 import sys
 import int_code_computer as icc
+import int_code_vector as icv
 
 LOGGER = logging.getLogger(__name__)
 
@@ -18,25 +19,27 @@ BOX_SIZE = 100
 # pylint: disable=invalid-name
 
 def get_beam(x, y, prog):
-    """ Get the beam value at the given co-ords """
-    input_data = [x, y]
-    comp = icc.IntCodeComputer(prog, input_data)
-    comp.run_program()
-    return comp.output.get()
+    """ Get the beam value at the given co-ords.
+        Beam value only depends on (x, y) so use the run cache.
+    """
+    return icc.cached_run(prog, [x, y])[0]
 
 def part_1():
     """ Count beam locations in first 50x50 grid """
     prog = icc.load_data('day_19_data.txt')
 
-    beam_count = 0
-    for y in range(0, 50):
-        for x in range(0, 50):
+    # Every co-ord is an independent run of the same program so run them in lockstep
+    coords = [(x, y) for y in range(0, 50) for x in range(0, 50)]
+    beams = icv.run_lockstep(prog, coords)
 
-            beam = get_beam(x, y, prog)
-            beam_count += beam
+    beam_count = 0
+    for (x, _), result in zip(coords, beams):
+        beam = result[0]
+        beam_count += beam
 
-            print(f'{beam}', end='')
-        print()
+        print(f'{beam}', end='')
+        if x == 49:
+            print()
 
     print("\nPart1:")
     print(f"Beam count in first 50x50 = {beam_count}")
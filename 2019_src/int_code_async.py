@@ -0,0 +1,112 @@
+'''
+Advent of Code 2019
+
+asyncio driver for int code computers
+
+Each machine runs as a task on the event loop using IntCodeComputer.step_until_io().
+Input and output are asyncio.Queue channels so a machine awaits its input channel
+when it needs data and other machines get to run in the meantime.  Outputs are
+put on the output channel, which can be the input channel of the next machine.
+
+This lets us run large networks of machines (hundreds of nodes) on one thread
+rather than one OS thread per machine.
+
+Note: machines only give way to each other on input / output so a machine that
+runs for a long time without doing any I/O will hold the event loop.
+
+'''
+
+import asyncio
+import logging
+
+import int_code_computer as icc
+
+LOGGER = logging.getLogger(__name__)
+
+# Reads a value, outputs value + 1 then halts
+TEST_INC = [3, 9, 1001, 9, 1, 9, 4, 9, 99, 0]
+
+class AsyncIntCodeComputer():
+    """ Int code computer with awaitable input and output channels """
+    def __init__(self, program, input_channel=None, output_channel=None,
+                 memory_model=icc.DictMemory):
+
+        self.comp = icc.IntCodeComputer(program, memory_model=memory_model)
+        self.input = asyncio.Queue() if input_channel is None else input_channel
+        self.output = asyncio.Queue() if output_channel is None else output_channel
+
+    @property
+    def result(self):
+        """ All the outputs the machine has produced """
+        return self.comp.result
+
+    @property
+    def halt_status(self):
+        """ True once the machine has halted """
+        return self.comp.halt_status
+
+    async def run_program(self):
+        """ Run the machine until it halts.  Awaits the input channel when
+            the machine needs input and passes each output to the output channel.
+        """
+        while True:
+            status = self.comp.step_until_io()
+
+            if status == icc.HALTED:
+                break
+
+            if status == icc.OUTPUT_READY:
+                await self.output.put(self.comp.output.get())
+                # Give the other machines a go
+                await asyncio.sleep(0)
+
+            elif status == icc.NEED_INPUT:
+                self.comp.input.put(await self.input.get())
+
+        LOGGER.debug('Machine halted')
+
+async def run_network(machines):
+    """ Run all the machines on the event loop until they have all halted """
+    await asyncio.gather(*[machine.run_program() for machine in machines])
+
+def build_ring(program, size):
+    """ Build a ring of machines where each output feeds the next machines input
+        and the last machine feeds the first one
+    """
+    machines = [AsyncIntCodeComputer(program) for _ in range(size)]
+    for i, machine in enumerate(machines):
+        machine.output = machines[(i + 1) % size].input
+    return machines
+
+async def run_feedback_loop(program, phase_settings):
+    """ Day 7 part 2 feedback loop with one task per amplifier """
+    amps = build_ring(program, len(phase_settings))
+
+    for amp, phase in zip(amps, phase_settings):
+        amp.input.put_nowait(phase)
+    amps[0].input.put_nowait(0)
+
+    await run_network(amps)
+    return amps[-1].result
+
+def run_tests():
+    """ Run test networks """
+
+    # A chain of machines that each add 1
+    chain_length = 200
+    machines = [AsyncIntCodeComputer(TEST_INC)]
+    for _ in range(chain_length - 1):
+        machines.append(AsyncIntCodeComputer(TEST_INC, input_channel=machines[-1].output))
+    machines[0].input.put_nowait(0)
+    asyncio.run(run_network(machines))
+    assert machines[-1].result == [chain_length]
+
+    # Day 7 part 2
+    program = icc.load_data('day_07_data.txt')
+    assert asyncio.run(run_feedback_loop(program, (5, 7, 6, 8, 9)))[-1] == 5371621
+
+    LOGGER.info('Async Instruction Computer: all tests pass')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_tests()
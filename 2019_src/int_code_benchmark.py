@@ -0,0 +1,301 @@
+'''
+Advent of Code 2019
+
+Benchmark for the int code computer
+
+Runs each of the int code puzzles (days 2, 5, 7, 9, 11, 13, 15, 17 and 19) headless
+against its data and reports for each one:
+    - wall time
+    - instructions retired (counted in a separate profiled run)
+    - peak memory allocated by Python (tracemalloc, separate run)
+    - the puzzle answer so we know the VM still gets it right
+
+Results are compared with int_code_benchmark_baseline.json.  A job is flagged if
+its answer or instruction count changes, it runs more than REGRESSION_LIMIT slower
+than the baseline (and at least TIME_FLOOR seconds slower, so tiny jobs are not
+flagged on timer noise) or its peak memory grows by more than MEMORY_LIMIT (and at
+least MEMORY_FLOOR bytes).  The exit status is 1 if anything was flagged.
+
+Usage:
+    python int_code_benchmark.py                    Run and compare with baseline
+    python int_code_benchmark.py --save             Run and save as the new baseline
+    python int_code_benchmark.py --compiled         Use the compiler
+    python int_code_benchmark.py --peephole         Fuse common instruction pairs
+    python int_code_benchmark.py --memory dense     Use DenseMemory (dict, dense, paged)
+    python int_code_benchmark.py day_09 day_13      Only run the given jobs
+
+'''
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+import int_code_computer as icc
+import day_02_1202_program_alarm as day_02
+import day_11_space_police as day_11
+import day_15_oxygen_system as day_15
+import day_17_set_and_forget as day_17
+
+LOGGER = logging.getLogger(__name__)
+
+BASELINE_FILE = 'int_code_benchmark_baseline.json'
+
+# Flag a job if it is this much slower than the baseline (0.2 = 20%)
+# and at least TIME_FLOOR seconds slower
+REGRESSION_LIMIT = 0.2
+TIME_FLOOR = 0.05
+
+# Flag a job if its peak memory is this much more than the baseline (0.5 = 50%)
+# and at least MEMORY_FLOOR bytes more
+MEMORY_LIMIT = 0.5
+MEMORY_FLOOR = 256 * 1024
+
+MEMORY_MODELS = {'dict': icc.DictMemory, 'dense': icc.DenseMemory, 'paged': icc.PagedMemory}
+
+class ComputerFactory():
+    """ Builds the computers for a job with the options we are benchmarking
+        and keeps hold of them so we can count instructions afterwards
+    """
+    def __init__(self, memory_model=icc.DictMemory, compiled=False, profile=False,
+                 peephole=False):
+        self.memory_model = memory_model
+        self.compiled = compiled
+        self.profile = profile
+        self.peephole = peephole
+        self.computers = []
+
+    def __call__(self, program, input_data=None):
+        comp = icc.IntCodeComputer(program, input_data, memory_model=self.memory_model,
+                                   compiled=self.compiled, profile=self.profile,
+                                   peephole=self.peephole)
+        if self.profile:
+            self.computers.append(comp)
+        return comp
+
+    def instructions(self):
+        """ Total instructions retired by all the computers we built """
+        return sum(comp.profile.instructions for comp in self.computers)
+
+def run(make_computer, program, input_data=None):
+    """ Run a computer to the end and return its outputs """
+    comp = make_computer(program, input_data)
+    if comp.run_until_input() != icc.HALTED:
+        raise ValueError('Program wants more input than it was given')
+    return comp.result
+
+def job_day_02(make_computer):
+    """ 1202 program alarm, then search for the noun / verb giving 19690720 """
+    program = list(day_02.PROGRAM)
+    program[1:3] = [12, 2]
+    comp = make_computer(program)
+    comp.run_program()
+    part_1 = comp.program.get(0)
+
+    for noun, verb in itertools.product(range(100), range(100)):
+        program[1:3] = [noun, verb]
+        comp = make_computer(program)
+        comp.run_program()
+        if comp.program.get(0) == 19690720:
+            return [part_1, 100 * noun + verb]
+    return [part_1, None]
+
+def job_day_05(make_computer):
+    """ Diagnostic codes for the air conditioner and thermal radiator """
+    program = icc.load_data('day_05_data.txt')
+    return [run(make_computer, program, [icc.AC_UNIT_ID])[-1],
+            run(make_computer, program, [icc.TRC_UNIT_ID])[-1]]
+
+def job_day_07(make_computer):
+    """ Max amplifier output for the chain and the feedback loop """
+    program = icc.load_data('day_07_data.txt')
+
+    part_1 = 0
+    for phases in itertools.permutations(range(5)):
+        signal = 0
+        for phase in phases:
+            signal = run(make_computer, program, [phase, signal])[-1]
+        part_1 = max(part_1, signal)
+
+    part_2 = 0
+    for phases in itertools.permutations(range(5, 10)):
+        amps = [make_computer(program, [phase]) for phase in phases]
+        amps[0].input.put(0)
+        icc.Network.ring(amps).run()
+        part_2 = max(part_2, amps[-1].result[-1])
+
+    return [part_1, part_2]
+
+def job_day_09(make_computer):
+    """ BOOST keycode and distress signal co-ords """
+    program = icc.load_data('day_09_data.txt')
+    return [run(make_computer, program, [1])[-1], run(make_computer, program, [2])[-1]]
+
+def job_day_11(make_computer):
+    """ Paint the registration identifier """
+    program = icc.load_data('day_11_data.txt')
+    painted = day_11.paint_sign(program, make_computer(program, [1]))
+    return [len(painted), sum(painted.values())]
+
+def job_day_13(make_computer):
+    """ Count the blocks then play the game with the paddle following the ball """
+    program = icc.load_data('day_13_data.txt')
+    part_1 = run(make_computer, program)[2::3].count(2)
+
+    program[0] = 2
+    comp = make_computer(program)
+    ball = paddle = score = 0
+    while True:
+        status = comp.run_until_input()
+        while not comp.output.empty():
+            x, y, tile = comp.output.get(), comp.output.get(), comp.output.get()
+            if (x, y) == (-1, 0):
+                score = tile
+            elif tile == 3:
+                paddle = x
+            elif tile == 4:
+                ball = x
+        if status == icc.HALTED:
+            break
+        comp.input.put((ball > paddle) - (ball < paddle))
+
+    return [part_1, score]
+
+def job_day_15(make_computer):
+    """ Map the maze and find the oxygen system """
+    program = icc.load_data('day_15.txt')
+    maze = day_15.build_maze(make_computer(program))
+    return [len(maze), list(day_15.find_position(maze, 'S'))]
+
+def job_day_17(make_computer):
+    """ Camera alignment parameters then move the robot to collect the dust """
+    program = icc.load_data('day_17_data.txt')
+    comp = make_computer(program)
+    comp.run_program()
+    maze = day_17.build_maze(comp.read_ascii().frames()[0])
+    part_1 = day_17.sum_alignments(day_17.find_crossings(maze))
+
+    program[0] = 2
+    comp = make_computer(program)
+    comp.send_ascii(day_17.build_instructions() + 'n\n')
+    comp.run_program()
+    part_2 = comp.read_ascii().values[-1]
+
+    return [part_1, part_2]
+
+def job_day_19(make_computer):
+    """ Count the points affected by the tractor beam in the 50x50 area """
+    program = icc.load_data('day_19_data.txt')
+    return [sum(run(make_computer, program, [x, y])[0]
+                for y in range(50) for x in range(50))]
+
+JOBS = {
+    'day_02': job_day_02,
+    'day_05': job_day_05,
+    'day_07': job_day_07,
+    'day_09': job_day_09,
+    'day_11': job_day_11,
+    'day_13': job_day_13,
+    'day_15': job_day_15,
+    'day_17': job_day_17,
+    'day_19': job_day_19,
+}
+
+def run_job(job, memory_model, compiled, peephole=False):
+    """ Run one job three times (timed, memory, instruction count).
+        Any printing from the puzzle code is thrown away.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        answer = job(ComputerFactory(memory_model, compiled, peephole=peephole))
+        wall_time = time.perf_counter() - start
+
+        tracemalloc.start()
+        job(ComputerFactory(memory_model, compiled, peephole=peephole))
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        factory = ComputerFactory(memory_model, profile=True)
+        job(factory)
+
+    return {'wall_time': wall_time,
+            'instructions': factory.instructions(),
+            'peak_memory': peak_memory,
+            'answer': answer}
+
+def compare(name, result, baseline):
+    """ Return a list of problems with the result compared to the baseline """
+    problems = []
+    if baseline is None:
+        return problems
+
+    if result['answer'] != baseline['answer']:
+        problems.append(f"answer {result['answer']} != baseline {baseline['answer']}")
+    if result['instructions'] != baseline['instructions']:
+        problems.append(f"instructions {result['instructions']} != "
+                        f"baseline {baseline['instructions']}")
+    if (result['wall_time'] > baseline['wall_time'] * (1 + REGRESSION_LIMIT) and
+            result['wall_time'] - baseline['wall_time'] >= TIME_FLOOR):
+        problems.append(f"wall time {result['wall_time']:.3f}s vs "
+                        f"baseline {baseline['wall_time']:.3f}s")
+    if (result['peak_memory'] > baseline['peak_memory'] * (1 + MEMORY_LIMIT) and
+            result['peak_memory'] - baseline['peak_memory'] >= MEMORY_FLOOR):
+        problems.append(f"peak memory {result['peak_memory'] // 1024}KB vs "
+                        f"baseline {baseline['peak_memory'] // 1024}KB")
+
+    return [f'{name}: {problem}' for problem in problems]
+
+def load_baseline(filename=BASELINE_FILE):
+    """ Load the saved baseline results (empty if we do not have one yet) """
+    try:
+        with open(filename, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def main():
+    """ Main Program.  Returns the exit status (1 if there were regressions). """
+    parser = argparse.ArgumentParser(description='Int code computer benchmark')
+    parser.add_argument('jobs', nargs='*', help=f"jobs to run (default all): {' '.join(JOBS)}")
+    parser.add_argument('--save', action='store_true', help='save results as the new baseline')
+    parser.add_argument('--compiled', action='store_true', help='use the int code compiler')
+    parser.add_argument('--peephole', action='store_true', help='fuse common instruction pairs')
+    parser.add_argument('--memory', choices=MEMORY_MODELS, default='dict', help='memory model')
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    results = {}
+    problems = []
+
+    print(f"{'Job':<8} {'Wall(s)':>9} {'Base(s)':>9} {'Instructions':>13} {'Peak(KB)':>9}")
+    for name in args.jobs or JOBS:
+        result = run_job(JOBS[name], MEMORY_MODELS[args.memory], args.compiled, args.peephole)
+        results[name] = result
+        base_time = baseline.get(name, {}).get('wall_time', float('nan'))
+        print(f"{name:<8} {result['wall_time']:>9.3f} {base_time:>9.3f} "
+              f"{result['instructions']:>13} {result['peak_memory'] // 1024:>9}")
+        problems += compare(name, result, baseline.get(name))
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w') as file:
+            json.dump(baseline, file, indent=4, sort_keys=True)
+        print(f'\nBaseline saved to {BASELINE_FILE}')
+
+    if problems:
+        print('\nRegressions:')
+        for problem in problems:
+            print(f'  {problem}')
+        return 1
+
+    print('\nNo regressions')
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
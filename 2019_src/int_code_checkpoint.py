@@ -0,0 +1,275 @@
+'''
+Advent of Code 2019
+
+Save an int code computer to disk and pick it up again later
+
+comp.save_checkpoint('game.iccp') writes the full machine state (memory, instruction
+pointer, relative base, pending input and output, result list, halt status,
+instruction count and output sink) and IntCodeComputer.load_checkpoint('game.iccp')
+builds a machine that carries on from there.  A long interactive session (the day 13
+game, mapping the day 15 maze) can then be resumed after a restart without running
+it all again.
+
+Checkpoint format (little endian varints as in int_code_trace, signed values
+zig-zag encoded):
+
+    b'ICCP' + version byte
+    flags (1 = halted, 2 = compiled, 4 = peephole), memory model index
+    output sink: index in OUTPUT_SINKS, or len(OUTPUT_SINKS) + N for a ring of N
+    instruction pointer, relative base, instruction count
+    input, output and result lists: length then the values
+    memory: number of non zero locations then for each one (in address order)
+            the address less the previous one and the value
+
+Only take a checkpoint while the machine is not executing (see snapshot()).  The file
+is written to a temporary name and renamed into place so a crash part way through a
+save leaves the last checkpoint intact.
+
+A callable output sink can not be saved.  It is written as None and the machine
+needs a new one: load_checkpoint(filename, output_sink=...).
+
+'''
+
+import logging
+import os
+import tempfile
+
+import int_code_computer as icc
+from int_code_trace import encode_varint, decode_varint, zigzag, unzigzag
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'ICCP'
+VERSION = 1
+CHECKPOINT_SUFFIX = '.iccp'
+
+HALTED_FLAG = 1
+COMPILED_FLAG = 2
+PEEPHOLE_FLAG = 4
+
+# Index stored in the file for each memory model
+MEMORY_MODELS = [icc.DictMemory, icc.DenseMemory, icc.PagedMemory]
+
+# Index stored in the file for each output sink.  Ring sizes come after these.
+OUTPUT_SINKS = [icc.OUTPUT_BOTH, icc.OUTPUT_QUEUE, icc.OUTPUT_LIST, None]
+
+def encode_output_sink(output_sink):
+    """ Number stored in the file for an output sink """
+    if output_sink in OUTPUT_SINKS:
+        return OUTPUT_SINKS.index(output_sink)
+    if isinstance(output_sink, int):
+        return len(OUTPUT_SINKS) + output_sink
+    # Callable.  The loader has to supply a new one.
+    return OUTPUT_SINKS.index(None)
+
+def decode_output_sink(code):
+    """ Output sink for a number written by encode_output_sink() """
+    if code < len(OUTPUT_SINKS):
+        return OUTPUT_SINKS[code]
+    return code - len(OUTPUT_SINKS)
+
+def encode_values(values, data):
+    """ Append a list of signed values to data """
+    values = list(values)
+    encode_varint(len(values), data)
+    for value in values:
+        encode_varint(zigzag(value), data)
+
+def decode_values(data, index):
+    """ Read a list written by encode_values().  Returns (values, next index) """
+    count, index = decode_varint(data, index)
+    values = []
+    for _ in range(count):
+        value, index = decode_varint(data, index)
+        values.append(unzigzag(value))
+    return values, index
+
+def encode_snapshot(snapshot):
+    """ Checkpoint bytes for an IntCodeComputer.snapshot() """
+    memory = snapshot['memory']
+    flags = ((HALTED_FLAG if snapshot['halt_status'] else 0) |
+             (COMPILED_FLAG if snapshot['compiled'] else 0) |
+             (PEEPHOLE_FLAG if snapshot['peephole'] else 0))
+
+    data = bytearray(MAGIC)
+    data.append(VERSION)
+    encode_varint(flags, data)
+    encode_varint(MEMORY_MODELS.index(type(memory)), data)
+    encode_varint(encode_output_sink(snapshot['output_sink']), data)
+    encode_varint(zigzag(snapshot['instruction_pointer']), data)
+    encode_varint(zigzag(snapshot['relative_base']), data)
+    encode_varint(snapshot['instruction_count'], data)
+    for values in (snapshot['input'], snapshot['output'], snapshot['result']):
+        encode_values(values, data)
+
+    locations = sorted((address, value) for address, value in memory.items() if value)
+    encode_varint(len(locations), data)
+    previous = 0
+    for address, value in locations:
+        encode_varint(zigzag(address - previous), data)
+        encode_varint(zigzag(value), data)
+        previous = address
+
+    return bytes(data)
+
+def decode_snapshot(data):
+    """ Snapshot dict (see IntCodeComputer.snapshot()) from checkpoint bytes """
+    if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != VERSION:
+        raise ValueError('Not an int code checkpoint')
+
+    index = len(MAGIC) + 1
+    flags, index = decode_varint(data, index)
+    model, index = decode_varint(data, index)
+    output_sink, index = decode_varint(data, index)
+    instruction_pointer, index = decode_varint(data, index)
+    relative_base, index = decode_varint(data, index)
+    instruction_count, index = decode_varint(data, index)
+    input_data, index = decode_values(data, index)
+    output_data, index = decode_values(data, index)
+    result, index = decode_values(data, index)
+
+    memory = MEMORY_MODELS[model]([])
+    count, index = decode_varint(data, index)
+    address = 0
+    for _ in range(count):
+        delta, index = decode_varint(data, index)
+        value, index = decode_varint(data, index)
+        address += unzigzag(delta)
+        memory[address] = unzigzag(value)
+
+    return {
+        'memory': memory,
+        'instruction_pointer': unzigzag(instruction_pointer),
+        'relative_base': unzigzag(relative_base),
+        'input': input_data,
+        'output': output_data,
+        'result': result,
+        'halt_status': bool(flags & HALTED_FLAG),
+        'instruction_count': instruction_count,
+        'compiled': bool(flags & COMPILED_FLAG),
+        'peephole': bool(flags & PEEPHOLE_FLAG),
+        'output_sink': decode_output_sink(output_sink),
+    }
+
+def save_checkpoint(comp, filename):
+    """ Write the state of the machine to filename """
+    data = encode_snapshot(comp.snapshot())
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as file:
+        file.write(data)
+    os.replace(file.name, filename)
+    LOGGER.debug('Checkpoint %s: %s bytes', filename, len(data))
+
+def load_checkpoint(filename, output_sink=None):
+    """ Build a machine from a checkpoint file.  output_sink replaces the saved one
+        (see IntCodeComputer.from_snapshot()).
+    """
+    with open(filename, 'rb') as file:
+        return icc.IntCodeComputer.from_snapshot(decode_snapshot(file.read()), output_sink)
+
+def play_day_13(comp, moves=None):
+    """ Play the day 13 game with the paddle following the ball.  Stops after
+        'moves' joystick inputs (None = until the game ends).  Returns the score.
+    """
+    ball = paddle = score = 0
+    while True:
+        status = comp.run_until_input()
+        outputs = icc.take_all(comp.output)
+        for x, y, tile in zip(outputs[::3], outputs[1::3], outputs[2::3]):
+            if (x, y) == (-1, 0):
+                score = tile
+            elif tile == 3:
+                paddle = x
+            elif tile == 4:
+                ball = x
+        if status == icc.HALTED or moves == 0:
+            return score
+        if moves is not None:
+            moves -= 1
+        comp.input.put((ball > paddle) - (ball < paddle))
+
+def run_tests():
+    """ Save and reload machines part way through a run """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test' + CHECKPOINT_SUFFIX)
+
+        # Every memory model.  Day 9 uses the relative base and big values.
+        program = icc.load_data('day_09_data.txt')
+        for memory_model in MEMORY_MODELS:
+            comp = icc.IntCodeComputer(program, [2], memory_model=memory_model)
+            comp.run_until_input()
+            save_checkpoint(comp, filename)
+            restored = load_checkpoint(filename)
+            assert isinstance(restored.program, memory_model)
+            assert restored.snapshot()['result'] == comp.result
+            assert restored.halt_status and restored.relative_base == comp.relative_base
+            assert ({item for item in restored.program.items() if item[1]} ==
+                    {item for item in comp.program.items() if item[1]})
+
+        # Blocked on input
+        comp = icc.IntCodeComputer(icc.TEST_3, output_sink=icc.OUTPUT_QUEUE)
+        comp.run_until_input()
+        save_checkpoint(comp, filename)
+        restored = load_checkpoint(filename)
+        restored.send(8)
+        assert restored.run_until_input() == icc.HALTED
+        assert restored.output.get() == 1000
+
+        # Stop the day 13 game part way through, reload it and finish it
+        program = icc.load_data('day_13_data.txt')
+        program[0] = 2
+        comp = icc.IntCodeComputer(program, compiled=True, output_sink=icc.OUTPUT_QUEUE)
+        play_day_13(comp, moves=1000)
+        comp.output.put(-1)
+        save_checkpoint(comp, filename)
+        LOGGER.info('Day 13 checkpoint after %s instructions: %s bytes',
+                    comp.instruction_count, os.path.getsize(filename))
+
+        restored = load_checkpoint(filename)
+        assert restored.compiled is not None and restored.output.get() == -1
+        assert restored.output_sink == icc.OUTPUT_QUEUE
+        comp.output.get()
+        count = restored.instruction_count
+        assert play_day_13(restored) == play_day_13(comp)
+        assert restored.instruction_count == comp.instruction_count > count
+        assert restored.result == comp.result == []
+
+        # Output sinks come back as they were
+        for output_sink in (icc.OUTPUT_BOTH, icc.OUTPUT_LIST, 3):
+            comp = icc.IntCodeComputer(icc.TEST_4, output_sink=output_sink)
+            comp.run(20)
+            save_checkpoint(comp, filename)
+            restored = load_checkpoint(filename)
+            assert restored.output_sink == output_sink
+            restored.resume()
+            comp.resume()
+            assert list(restored.result) == list(comp.result)
+            assert icc.take_all(restored.output) == icc.take_all(comp.output)
+        assert restored.result.maxlen == 3
+
+        # A callable sink can not be saved so one has to be given on loading
+        comp = icc.IntCodeComputer(icc.TEST_4, output_sink=[].append)
+        comp.run(20)
+        save_checkpoint(comp, filename)
+        try:
+            load_checkpoint(filename)
+            assert False, 'Expected ValueError for a callable output sink'
+        except ValueError:
+            pass
+        outputs = []
+        restored = load_checkpoint(filename, output_sink=outputs.append)
+        restored.resume()
+        assert outputs and outputs == icc.TEST_4[-len(outputs):]
+
+        # A machine that jumped to a negative address and halted
+        comp = icc.IntCodeComputer([1105, 1, -1])
+        comp.run_program()
+        save_checkpoint(comp, filename)
+        restored = load_checkpoint(filename)
+        assert restored.halt_status and restored.instruction_pointer == -1
+
+    LOGGER.info('Int code checkpoint: all tests pass')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_tests()
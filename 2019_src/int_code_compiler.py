@@ -0,0 +1,381 @@
+'''
+Advent of Code 2019
+
+Int code to Python compiler
+
+Turns int code into Python source with one function per block of instructions.
+A block runs straight line arithmetic on local variables and returns the address of
+the next block together with the new relative base and the number of instructions
+it executed.  Blocks stop at I/O (op-codes 3
+and 4), halt, unknown op-codes and unconditional jumps.  Those are left to the normal
+IntCodeComputer interpreter so all the input / output handling stays in one place.
+
+Blocks reachable from the entry address through immediate mode jumps are compiled up
+front.  Anything else (e.g. return addresses used by relative mode jumps) is compiled
+the first time we land on it.
+
+Compiled code treats the argument words of each instruction as constants.  Writes
+to compiled code are checked:
+ - A write to an argument word (e.g. programs that patch the address in an instruction
+   to index an array) marks that word as variable and recompiles the blocks that use
+   it so they read the word from memory from then on.  Words we already know are
+   written (see int_code_disassembler) can be passed in as volatile up front.
+ - A write to an op-code word raises CodeModified and the machine drops all the
+   compiled code and carries on in the interpreter.
+
+Usage: IntCodeComputer(program, compiled=True)
+
+'''
+
+import logging
+
+import int_code_computer as icc
+
+LOGGER = logging.getLogger(__name__)
+
+# Max instructions in one block
+MAX_BLOCK_SIZE = 200
+
+# Op-codes that we compile
+COMPILED_OP_CODES = [1, 2, 5, 6, 7, 8, 9]
+
+class CodeModified(Exception):
+    """ Raised by compiled code after it writes to an address that holds compiled code.
+        args = (next instruction address, relative base, address written,
+                instructions executed in the block)
+    """
+
+class CompiledProgram():
+    """ Compiled blocks for the program in the given memory """
+    def __init__(self, memory, entry=0, volatile=()):
+        self.memory = memory
+
+        # key = block start address, val = block function or None if there is
+        # nothing we can compile at that address
+        self.blocks = {}
+        # key = block start address, val = most instructions the block can run
+        self.sizes = {}
+
+        # Op-code addresses of compiled instructions and the I/O etc. instructions
+        # the blocks stop at
+        self.op_codes = set()
+        # key = argument address compiled as a constant, val = set of block starts using it
+        self.owners = {}
+        # Argument addresses that have been written to so are read at run time
+        self.volatile = set(volatile)
+        # Writes to any of these addresses have to be checked (op_codes + owners)
+        self.code = set()
+
+        self.namespace = {'m': memory,
+                          'mg': memory.get,
+                          'CODE': self.code,
+                          'CodeModified': CodeModified}
+
+        self.compile_reachable(entry)
+
+    def decode(self, address):
+        """ Return (op_code, modes, size) for the instruction at address.
+            op_code is None if it is not a valid instruction.
+        """
+        value = self.memory.get(address, 0)
+        op_code = value % 100 if value >= 0 else None
+        size = icc.INSTRUCTION_SIZE.get(op_code)
+        modes = (value // 100 % 10, value // 1000 % 10, value // 10000 % 10)
+        if size is None or any(mode not in (icc.P_MODE, icc.I_MODE, icc.R_MODE)
+                               for mode in modes[:size - 1]):
+            return None, modes, 0
+        return op_code, modes, size
+
+    def word_source(self, address, constants):
+        """ Python expression for the argument word at address.  A literal unless
+            the program has written to it.
+        """
+        if address in self.volatile:
+            return f'mg({address}, 0)'
+        constants.append(address)
+        return repr(self.memory.get(address, 0))
+
+    def read_source(self, address, mode, constants):
+        """ Python expression that reads the argument at address """
+        word = self.word_source(address, constants)
+        if mode == icc.I_MODE:
+            return word
+        if mode == icc.P_MODE:
+            return f'mg({word}, 0)'
+        return f'mg(rb + {word}, 0)'
+
+    def write_source(self, address, mode, expression, next_address, count, constants):
+        """ Python lines that write expression to the result address at address.
+            count = instructions executed in the block once this one is done
+        """
+        word = self.word_source(address, constants)
+        if mode == icc.P_MODE and address not in self.volatile:
+            target = word
+            lines = []
+        else:
+            target = 'a'
+            lines = [f'a = {word}' if mode == icc.P_MODE else f'a = rb + {word}']
+
+        lines.append(f'm[{target}] = {expression}')
+        lines.append(f'if {target} in CODE:')
+        lines.append(f'    raise CodeModified({next_address}, rb, {target}, {count})')
+        return lines
+
+    def block_source(self, start):
+        """ Generate the source for the block starting at start.
+
+            Returns (source, op-code addresses, constant argument addresses,
+            static jump targets).  source is None if there is nothing to compile
+            at start.
+        """
+        indent = '    '
+        lines = []
+        op_codes = []
+        constants = []
+        targets = []
+        address = start
+        count = 0
+        jumped = False
+
+        while count < MAX_BLOCK_SIZE:
+            op_code, modes, size = self.decode(address)
+
+            # Writes in immediate mode are not valid so leave them to the interpreter
+            if op_code in [1, 2, 7, 8] and modes[2] == icc.I_MODE:
+                op_code = None
+
+            op_codes.append(address)
+
+            if op_code not in COMPILED_OP_CODES:
+                # Stop here.  The interpreter does this instruction and then we
+                # carry on with the block after it.
+                if size and op_code != 99:
+                    targets.append(address + size)
+                break
+
+            next_address = address + size
+            arg1 = self.read_source(address + 1, modes[0], constants)
+            if size > 2:
+                arg2 = self.read_source(address + 2, modes[1], constants)
+            lines.append(f'# {address}: ' +
+                         ', '.join(str(self.memory.get(addr, 0))
+                                   for addr in range(address, next_address)))
+
+            if op_code == 1:
+                lines += self.write_source(address + 3, modes[2], f'{arg1} + {arg2}',
+                                           next_address, count + 1, constants)
+            elif op_code == 2:
+                lines += self.write_source(address + 3, modes[2], f'{arg1} * {arg2}',
+                                           next_address, count + 1, constants)
+            elif op_code == 7:
+                lines += self.write_source(address + 3, modes[2],
+                                           f'1 if {arg1} < {arg2} else 0',
+                                           next_address, count + 1, constants)
+            elif op_code == 8:
+                lines += self.write_source(address + 3, modes[2],
+                                           f'1 if {arg1} == {arg2} else 0',
+                                           next_address, count + 1, constants)
+            elif op_code == 9:
+                lines.append(f'rb += {arg1}')
+
+            else:
+                # Jumps.  Immediate mode targets get compiled up front.
+                if modes[1] == icc.I_MODE and address + 2 not in self.volatile:
+                    targets.append(self.memory.get(address + 2, 0))
+
+                if modes[0] == icc.I_MODE and address + 1 not in self.volatile:
+                    # Condition is a constant so we either always or never jump
+                    if bool(self.memory.get(address + 1, 0)) == (op_code == 5):
+                        lines.append(f'return {arg2}, rb, {count + 1}')
+                        jumped = True
+                        count += 1
+                        break
+                else:
+                    condition = arg1 if op_code == 5 else f'not {arg1}'
+                    lines.append(f'if {condition}:')
+                    lines.append(f'    return {arg2}, rb, {count + 1}')
+
+            address = next_address
+            count += 1
+        else:
+            # Block is full so carry on in the next block
+            targets.append(address)
+
+        if count == 0:
+            return None, op_codes, constants, targets
+
+        if not jumped:
+            lines.append(f'return {address}, rb, {count}')
+
+        header = f'def block_{start}(rb, m=m, mg=mg, CODE=CODE, CodeModified=CodeModified):'
+        source = '\n'.join([header] + [indent + line for line in lines]) + '\n'
+        return source, op_codes, constants, targets
+
+    def compile_block(self, start):
+        """ Compile the block at start (if we have not already) and return it """
+        if start in self.blocks:
+            return self.blocks[start]
+
+        self.compile_reachable(start)
+        return self.blocks[start]
+
+    def compile_reachable(self, entry):
+        """ Compile entry and every block reachable from it through static jumps.
+            All the source is exec'd in one go.
+        """
+        sources = []
+        new_blocks = []
+        to_do = [entry]
+
+        while to_do:
+            start = to_do.pop()
+            if start in self.blocks:
+                continue
+            if start < 0:
+                # Not a valid address.  Left to the interpreter, which halts.
+                self.blocks[start] = None
+                continue
+
+            source, op_codes, constants, targets = self.block_source(start)
+            self.blocks[start] = None
+            self.sizes[start] = len(op_codes)
+            self.op_codes.update(op_codes)
+            self.code.update(op_codes)
+            for address in constants:
+                self.owners.setdefault(address, set()).add(start)
+            self.code.update(constants)
+
+            to_do.extend(targets)
+            if source is not None:
+                sources.append(source)
+                new_blocks.append(start)
+
+        if sources:
+            exec('\n'.join(sources), self.namespace) # pylint: disable=exec-used
+            for start in new_blocks:
+                self.blocks[start] = self.namespace[f'block_{start}']
+
+        LOGGER.debug('Compiled %s blocks from %s', len(new_blocks), entry)
+
+    def code_written(self, address):
+        """ Deal with a write to an address in self.code.
+            Returns True if an op-code was overwritten and we have to stop
+            using the compiled code.
+        """
+        if address in self.op_codes:
+            return True
+
+        # Argument word.  Recompile the blocks using it (when we next get to
+        # them) so they read it from memory.
+        self.volatile.add(address)
+        self.code.discard(address)
+        for start in self.owners.pop(address, ()):
+            self.blocks.pop(start, None)
+        return False
+
+    def run(self, instruction_pointer, relative_base, limit=None):
+        """ Run compiled blocks from instruction_pointer until we reach something
+            we have to interpret.  If limit is given we also stop before a block
+            that could take us past limit instructions.
+
+            Returns (instruction_pointer, relative_base, code_modified, instructions executed)
+        """
+        blocks = self.blocks
+        sizes = self.sizes
+        compile_block = self.compile_block
+        count = 0
+        while True:
+            try:
+                while True:
+                    block = blocks.get(instruction_pointer)
+                    if block is None:
+                        if instruction_pointer in blocks:
+                            return instruction_pointer, relative_base, False, count
+                        block = compile_block(instruction_pointer)
+                        if block is None:
+                            return instruction_pointer, relative_base, False, count
+                    if limit is not None and count + sizes[instruction_pointer] > limit:
+                        return instruction_pointer, relative_base, False, count
+                    instruction_pointer, relative_base, executed = block(relative_base)
+                    count += executed
+
+            except CodeModified as err:
+                instruction_pointer, relative_base, address, executed = err.args
+                count += executed
+                if self.code_written(address):
+                    return instruction_pointer, relative_base, True, count
+
+def source(program):
+    """ Return the compiled Python source for the program (for inspection) """
+    compiled = CompiledProgram(icc.DictMemory(program))
+    return '\n'.join(compiled.block_source(start)[0] for start in sorted(compiled.blocks)
+                      if compiled.blocks[start] is not None)
+
+def run_tests():
+    """ Compare compiled runs with the interpreter """
+
+    tests = [(icc.TEST_1, [0]), (icc.TEST_1, [1]), (icc.TEST_2, [0]), (icc.TEST_2, [1]),
+             (icc.TEST_3, [7]), (icc.TEST_3, [8]), (icc.TEST_3, [9]), (icc.TEST_4, None),
+             (icc.TEST_5, None), (icc.TEST_6, None), (icc.TEST_7, None),
+             ([1105, 1, -1], None), ([3, 9, 1006, 9, -4, 104, 1, 99, 0, 0], [0])]
+
+    for filename, input_data in [('day_05_data.txt', [icc.AC_UNIT_ID]),
+                                 ('day_05_data.txt', [icc.TRC_UNIT_ID]),
+                                 ('day_09_data.txt', [1]),
+                                 ('day_09_data.txt', [2]),
+                                 ('day_19_data.txt', [10, 12])]:
+        tests.append((icc.load_data(filename), input_data))
+
+    for program, input_data in tests:
+        comp = icc.IntCodeComputer(program, input_data, compiled=True)
+        comp.run_program()
+        interpreted = icc.IntCodeComputer(program, input_data)
+        interpreted.run_program()
+        assert comp.result == interpreted.result
+        assert comp.instruction_count == interpreted.instruction_count
+
+    # Jumps to a negative address are left to the interpreter, which halts
+    comp = icc.IntCodeComputer([1105, 1, -1], compiled=True)
+    comp.run_program()
+    assert comp.halt_status and comp.instruction_pointer == -1
+    assert comp.compiled is not None and comp.compiled.blocks[-1] is None
+
+    # Self modifying code is not compiled
+    comp = icc.IntCodeComputer(icc.TEST_7, compiled=True)
+    comp.run_program()
+    assert comp.compiled is None and comp.result == [7, 0]
+
+    # If it is compiled anyway, the write to a compiled op-code drops the machine
+    # back to the interpreter part way through the run
+    for program, input_data in [(icc.TEST_7, None),
+                                (icc.load_data('day_05_data.txt'), [icc.TRC_UNIT_ID])]:
+        comp = icc.IntCodeComputer(program, input_data)
+        comp.compiled = CompiledProgram(comp.program)
+        comp.run_program()
+        assert comp.compiled is None
+        assert comp.result == icc.run_computer(program, input_data)
+
+    # Instruction budget.  Compiled blocks stop short rather than overrun it.
+    program = icc.load_data('day_09_data.txt')
+    for max_steps in (1, 7, 150, 5000):
+        comp = icc.IntCodeComputer(program, [2], compiled=True)
+        while comp.instruction_count < 20000:
+            count = comp.instruction_count
+            assert comp.run(max_steps) == icc.BUDGET_EXHAUSTED
+            assert comp.instruction_count == count + max_steps
+        assert comp.run() == icc.OUTPUT_READY and comp.run() == icc.HALTED
+        assert comp.result == icc.run_computer(program, [2])
+
+    # Day 13 patches instruction arguments to index its arrays.  Those words
+    # become variables and we keep running compiled.
+    program = icc.load_data('day_13_data.txt')
+    comp = icc.IntCodeComputer(program, compiled=True)
+    comp.run_program()
+    assert comp.compiled is not None and comp.compiled.volatile
+    assert comp.result == icc.run_computer(program, None)
+
+    LOGGER.info('Int code compiler: all tests pass')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_tests()
@@ -20,11 +20,123 @@ Modify esiting module to include the new addressing mode
 mode 2 = relative mode (addresses are relative to rel_base e.g add = arg + rel_base)
 opCode 9: adjust relative_base.  Takes one argument, which is the new relative_base value
 
+Added a decode cache.  Each instruction is decoded once (op-code, arg modes and size)
+the first time it is executed and the result is kept against its address.  A write
+that lands inside a cached instruction throws that entry away so self modifying
+code still behaves.
+
+Program memory is now pluggable.  DictMemory is the original dict model.  DenseMemory
+keeps the program image plus some headroom in a list and only sends far away
+addresses to a dict.  Pick one per machine with IntCodeComputer(..., memory_model=X).
+
+Added snapshot() / fork().  A snapshot holds the full machine state and fork() builds
+a new machine from it.  With PagedMemory the memory is split into pages that are
+shared between the copies and only copied when one side writes to them.
+
+Input no longer sleep-polls.  Op-code 3 blocks on the input queue and sets the
+awaiting_input event while it waits (also set on halt) so drivers can wait on it
+instead of polling 'waiting'.  Use send() to give input to a machine that a driver
+is waiting on.
+
+Added a thread free way to drive a machine.  step_until_io() runs until the machine
+needs input we do not have, has just output a value or has halted and returns which.
+run_until_input() keeps going through outputs and only stops for input or halt.
+Drivers then talk to the machine through the input / output queues in the same thread.
+
+Added run_batch() to run one program against many input vectors on a process pool.
+The program is sent to each worker process once when the pool starts.
+
+Added IntCodeComputer(..., compiled=True).  Straight line code is compiled to Python
+functions (see int_code_compiler) and the interpreter only runs I/O, halt and anything
+that could not be compiled.  If the program writes over a compiled op-code we throw the
+compiled code away and carry on interpreting.
+
+Added an opt-in execution profile.  IntCodeComputer(..., profile=True) or
+enable_profiling() counts instructions per op-code and per address, the total
+retired, instructions per second and time spent blocked on input.  Get the results
+from comp.profile.report() or comp.profile.histogram().  Profiling is done in the
+interpreter so it turns compiled code off.
+
+Added RunCache for runs that only depend on the program and the input we give it.
+Results are keyed on a hash of the program contents plus the input values, kept in
+an LRU of limited size and optionally in a shelve file on disk.  cached_run() uses a
+module level cache.
+
+Machines now count the instructions they retire in instruction_count (compiled blocks
+report how many they ran).  Set comp.trace to an int_code_trace.TraceRecorder to
+record every input / output with the instruction count it happened at.
+
+Output handling is configurable with IntCodeComputer(..., output_sink=X):
+    OUTPUT_BOTH   output queue and result list (default, as before)
+    OUTPUT_QUEUE  output queue only.  result stays empty.
+    OUTPUT_LIST   result list only.  Nothing goes on the output queue.
+    int N         result is a ring holding the last N outputs.  No queue.
+    callable      called with each output value.  No queue or result.
+
+Split execution into a fast loop and a traced loop.  process_instruction() no longer
+logs anything.  The loop is picked once each time we start running: if the machine
+has hooks (add_hook(), the profiler) or debug logging is on we use the traced loop,
+which calls every hook with (address, op_code) before each instruction.  Otherwise
+we use the fast loop (and compiled code if we have it).
+
+compile() runs the static analysis in int_code_disassembler first.  Programs that
+write over their own op-codes are left to the interpreter and argument words the
+program writes to are compiled as variables from the start.
+
+Added a peephole pass, IntCodeComputer(..., peephole=True).  When an instruction is
+decoded we look at the ones after it.  While each pair is a common idiom the run of
+instructions is cached as one fused instruction (op-code FUSED) and run in a single
+dispatch.  The idioms are:
+    IDIOM_COMPARE_JUMP  07 / 08 then 05 / 06 on the compare result
+    IDIOM_ADD_COMPARE   add with an immediate step then a compare on the sum
+                        (loop counter increment and test)
+    IDIOM_FRAME_STORE   09 or a relative mode store then another store (stack frame
+                        set up)
+Fusion is only used in the fast loop so hooks still see every instruction.
+
+load_data(filename, use_image=True) reads a binary program image (int_code_image) in
+place of the text file when there is an up to date one, so there is no text to parse.
+Images are only used when asked for so a stale image is never picked up by accident.
+
+Added ASCII I/O.  send_ascii() sends a whole str / bytes and read_ascii() takes all
+the waiting output in one go and splits it into text (with lines() and frames()) and
+any values that are not ASCII (e.g. a final answer).  On a Channel both move the
+whole batch in one go rather than once per character.
+
+Input and output queues are now Channels by default.  A Channel is a deque with one
+Event that is only touched when the reader is actually blocked, so put() / get()
+do not take a lock.  It is safe for one writer and one reader thread.  A
+queue.Queue can still be passed in for input_data / output_data.
+
+Added Network to run a set of machines round robin in one thread.  Each machine runs
+until it blocks on input or halts, then its outputs are routed to the machines it is
+connected to and any of those that were waiting get another turn.  run() stops when
+all the machines have halted or when they are all waiting for input (idle, or a
+deadlock if nothing outside the network is going to send them anything).
+
+Added run(max_steps) to run a machine for a limited number of instructions.  It
+returns like step_until_io() or BUDGET_EXHAUSTED when it has run max_steps, with the
+machine ready to carry on from there on the next call.  Compiled blocks that could
+go past the budget and the tail of a fused instruction are left to the plain
+interpreter so the count is exact.
+
+Added save_checkpoint() / load_checkpoint() to write the full machine state to a
+file and build a machine from it later (see int_code_checkpoint).
+
 '''
 
+import collections
+import concurrent.futures
+import gc
+import hashlib
 import queue
 import logging
+import os
+import shelve
+import tempfile
+import threading
 import time
+import weakref
 
 LOGGER = logging.getLogger(__name__)
 
@@ -36,6 +148,51 @@ R_MODE = 2
 AC_UNIT_ID = 1
 TRC_UNIT_ID = 5
 
+# Number of memory locations used by each instruction (op-code + args)
+INSTRUCTION_SIZE = {1: 4, 2: 4, 3: 2, 4: 2, 5: 3, 6: 3, 7: 4, 8: 4, 9: 2, 99: 1}
+
+# Fused instruction op-code (peephole=True).  Outside the 0 - 99 op-code range.
+FUSED = 100
+
+# Instruction pairs the peephole pass fuses (see match_idiom())
+IDIOM_COMPARE_JUMP = 'compare jump'
+IDIOM_ADD_COMPARE = 'add compare'
+IDIOM_FRAME_STORE = 'frame store'
+
+# Max instructions in one fused instruction
+MAX_FUSED = 8
+
+
+# step_until_io() / run_until_input() / run() return values
+HALTED = 'halted'
+NEED_INPUT = 'need input'
+OUTPUT_READY = 'output ready'
+BUDGET_EXHAUSTED = 'budget exhausted'
+
+# Outputs up to this value are ASCII text for read_ascii()
+ASCII_MAX = 127
+
+# Network.run() return value when every machine that has not halted is
+# waiting for input and there is nothing left to deliver
+IDLE = 'idle'
+
+# Programs whose hash RunCache keeps (most recently used)
+PROGRAM_HASH_LIMIT = 8
+
+# Output sinks
+OUTPUT_BOTH = 'both'
+OUTPUT_QUEUE = 'queue'
+OUTPUT_LIST = 'list'
+
+# DenseMemory will grow its list to cover writes up to this many locations
+# past the current end.  Anything further out goes into the sparse dict.
+DENSE_GROW_LIMIT = 4096
+DENSE_HEADROOM = 1024
+
+# PagedMemory page size = 2 ** PAGE_BITS locations
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
 
 # Test 1,2 give output 0 if input 0 and output 1 if input 1
 TEST_1 = [3, 12, 6, 12, 15, 1, 13, 14, 13, 4, 13, 99, -1, 0, 1, 9] # Jump test - Position mode
@@ -55,9 +212,153 @@ TEST_5 = [1102, 34915192, 34915192, 7, 4, 7, 99, 0]
 # Test 6 - Outputs the large number in the middle
 TEST_6 = [104, 1125899906842624, 99]
 
+# Test 7 - self modifying code.  Outputs 7 then patches the output op-code
+# to position mode and loops back round so the second output is mem[7] = 0
+TEST_7 = [104, 7, 1008, 0, 104, 100, 1101, 0, 4, 0, 1005, 100, 0, 99]
+
+
+def log_instruction(address, op_code):
+    """ Trace hook that logs each instruction at debug level """
+    LOGGER.debug((address, op_code))
+
+class Channel():
+    """ Single producer / single consumer queue.  A drop in for the parts of
+        queue.Queue that the machines use.
+
+        Values go in a deque.  The wakeup Event is only used when the reader has
+        found the channel empty and is about to block (reader_waiting), so
+        put() and get() normally take no locks.
+    """
+    def __init__(self, values=()):
+        self.queue = collections.deque(values)
+        self.wakeup = threading.Event()
+        self.reader_waiting = False
+
+    def put(self, value):
+        """ Add a value """
+        self.queue.append(value)
+        if self.reader_waiting:
+            self.wakeup.set()
+
+    put_nowait = put
+
+    def put_all(self, values):
+        """ Add a batch of values """
+        self.queue.extend(values)
+        if self.reader_waiting:
+            self.wakeup.set()
+
+    def get(self, block=True, timeout=None):
+        """ Remove and return the next value.  Blocks until there is one unless
+            block is False.  Raises queue.Empty if there is nothing to return.
+        """
+        channel = self.queue
+        while True:
+            if channel:
+                return channel.popleft()
+            if not block:
+                raise queue.Empty
+
+            # Say we are waiting then check again so a put() between the
+            # check and the wait is not missed
+            self.wakeup.clear()
+            self.reader_waiting = True
+            if not channel and not self.wakeup.wait(timeout):
+                self.reader_waiting = False
+                raise queue.Empty
+            self.reader_waiting = False
+
+    def get_nowait(self):
+        """ Remove and return the next value.  Raises queue.Empty if there is none. """
+        return self.get(block=False)
+
+    def take_all(self):
+        """ Remove and return all the values """
+        values = list(self.queue)
+        self.queue.clear()
+        return values
+
+    def empty(self):
+        """ True if there is nothing waiting """
+        return not self.queue
+
+    def qsize(self):
+        """ Number of values waiting """
+        return len(self.queue)
+
+def put_all(channel, values):
+    """ Put a batch of values on a Channel (in one go) or any other queue (one
+        put() at a time so its own size limit and ordering still apply)
+    """
+    if isinstance(channel, Channel):
+        channel.put_all(values)
+        return
+
+    for value in values:
+        channel.put(value)
+
+def take_all(channel):
+    """ Remove and return all the values waiting on a Channel or any other queue """
+    if isinstance(channel, Channel):
+        return channel.take_all()
+
+    values = []
+    try:
+        while True:
+            values.append(channel.get_nowait())
+    except queue.Empty:
+        return values
+
+def decode_op_code(value):
+    """ Decode an op-code word into (op_code, arg1 mode, arg2 mode, arg3 mode, size).
+        op_code is None (and size 0) if it is not a valid instruction.
+    """
+    op_code = value % 100 if value >= 0 else None
+    size = INSTRUCTION_SIZE.get(op_code)
+    if size is None:
+        return None, 0, 0, 0, 0
+    return op_code, value // 100 % 10, value // 1000 % 10, value // 10000 % 10, size
+
+def match_idiom(memory, address, first, second):
+    """ Peephole check on the decoded instructions at address and the one after it.
+        Returns the IDIOM_* for the pair or None if they are not an idiom we fuse.
+    """
+    op_1, mode_1, mode_2, mode_3, size = first
+    op_2, mode_2_1, mode_2_2, mode_2_3, _ = second
+    second_address = address + size
+
+    def uses_result(arg_address, mode):
+        """ True if the second instruction arg reads the value the first one wrote.
+            Relative mode is fine as there is no 09 between them.
+        """
+        return (mode == mode_3 and mode in (P_MODE, R_MODE) and
+                memory.get(arg_address, 0) == memory.get(address + 3, 0))
+
+    if op_1 in (7, 8) and op_2 in (5, 6) and uses_result(second_address + 1, mode_2_1):
+        return IDIOM_COMPARE_JUMP
+
+    if op_1 == 1 and op_2 in (7, 8) and I_MODE in (mode_1, mode_2) and (
+            uses_result(second_address + 1, mode_2_1) or
+            uses_result(second_address + 2, mode_2_2)):
+        return IDIOM_ADD_COMPARE
+
+    # Frame set up: 09 or a store into the frame followed by another store
+    if op_2 in (1, 2, 7, 8) and (op_1 == 9 or (op_1 in (1, 2, 7, 8) and
+                                               mode_3 == mode_2_3 == R_MODE)):
+        return IDIOM_FRAME_STORE
+
+    return None
+
+def load_data(filename, use_image=False):
+    """ Load the mass data file.  With use_image, uses the binary image (see
+        int_code_image) instead if there is an up to date one.
+    """
+    if use_image:
+        import int_code_image # pylint: disable=import-outside-toplevel
+        image = int_code_image.find_image(filename)
+        if image is not None:
+            return int_code_image.load_image(image)
 
-def load_data(filename):
-    """ Load the mass data file """
     data = []
     with open(filename, 'r') as file:
         for line in file:
@@ -65,37 +366,569 @@ def load_data(filename):
 
     return data
 
+class DictMemory(dict):
+    """ Program memory as a dict.
+        key = address, val = memory contents of 'key' location.
+    """
+    def __init__(self, program):
+        super().__init__(enumerate(program))
+
+    def copy(self):
+        """ Return an independent copy of the memory """
+        memory = DictMemory([])
+        memory.update(self)
+        return memory
+
+class DenseMemory():
+    """ Program memory as a list covering the program image plus some headroom.
+        The list grows for writes just past the end and anything further away
+        is kept in a sparse dict.  Reads of unset locations return 0.
+    """
+    def __init__(self, program):
+        self.dense = list(program) + [0] * DENSE_HEADROOM
+        self.sparse = {}
+
+    def get(self, address, default=0):
+        """ Read the given address """
+        if 0 <= address < len(self.dense):
+            return self.dense[address]
+        return self.sparse.get(address, default)
+
+    def __getitem__(self, address):
+        return self.get(address)
+
+    def __setitem__(self, address, value):
+        size = len(self.dense)
+        if 0 <= address < size:
+            self.dense[address] = value
+        elif size <= address < size + DENSE_GROW_LIMIT:
+            self.grow(address + 1)
+            self.dense[address] = value
+        else:
+            self.sparse[address] = value
+
+    def __contains__(self, address):
+        return 0 <= address < len(self.dense) or address in self.sparse
+
+    def items(self):
+        """ (address, value) for every location held """
+        yield from enumerate(self.dense)
+        yield from self.sparse.items()
+
+    def grow(self, min_size):
+        """ Extend the dense region to at least min_size locations and move any
+            sparse values that now fall inside it
+        """
+        old_size = len(self.dense)
+        new_size = max(min_size, 2 * old_size)
+        self.dense.extend([0] * (new_size - old_size))
+
+        for address in [addr for addr in self.sparse if old_size <= addr < new_size]:
+            self.dense[address] = self.sparse.pop(address)
+
+    def copy(self):
+        """ Return an independent copy of the memory """
+        memory = DenseMemory([])
+        memory.dense = list(self.dense)
+        memory.sparse = dict(self.sparse)
+        return memory
+
+class PagedMemory():
+    """ Program memory split into fixed size pages with copy-on-write sharing.
+
+        copy() only copies the page table.  Pages are then shared by both
+        memories and a page is only duplicated when one of them writes to it.
+        Unset locations (and pages) read as 0.
+    """
+    def __init__(self, program):
+        # key = page number, val = list of PAGE_SIZE locations
+        self.pages = {}
+        # Page numbers that are private to this memory and can be written in place
+        self.owned = set()
+
+        for address, value in enumerate(program):
+            self[address] = value
+
+    def get(self, address, default=0):
+        """ Read the given address """
+        page = self.pages.get(address >> PAGE_BITS)
+        if page is None:
+            return default
+        return page[address & PAGE_MASK]
+
+    def __getitem__(self, address):
+        return self.get(address)
+
+    def __setitem__(self, address, value):
+        number = address >> PAGE_BITS
+        if number not in self.owned:
+            page = self.pages.get(number)
+            self.pages[number] = list(page) if page else [0] * PAGE_SIZE
+            self.owned.add(number)
+        self.pages[number][address & PAGE_MASK] = value
+
+    def __contains__(self, address):
+        return (address >> PAGE_BITS) in self.pages
+
+    def items(self):
+        """ (address, value) for every location in the allocated pages """
+        for number, page in self.pages.items():
+            yield from enumerate(page, number << PAGE_BITS)
+
+    def copy(self):
+        """ Return a copy that shares all pages with this one.  Neither side owns
+            the shared pages any more so the next write to them makes a private copy.
+        """
+        memory = PagedMemory([])
+        memory.pages = dict(self.pages)
+        self.owned = set()
+        return memory
+
+class ExecutionProfile():
+    """ Execution counters for one int code computer """
+    def __init__(self):
+        # key = op_code / address, val = number of times executed
+        self.op_codes = collections.Counter()
+        self.addresses = collections.Counter()
+        self.instructions = 0
+
+        # Seconds spent blocked waiting for input
+        self.input_wait = 0.0
+        self.blocked_since = None
+
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def record(self, address, op_code):
+        """ Count one instruction """
+        self.instructions += 1
+        self.op_codes[op_code] += 1
+        self.addresses[address] += 1
+
+    def block(self):
+        """ Mark the start of a wait for input (if we are not already waiting) """
+        if self.blocked_since is None:
+            self.blocked_since = time.perf_counter()
+
+    def unblock(self):
+        """ Mark the end of a wait for input """
+        if self.blocked_since is not None:
+            self.input_wait += time.perf_counter() - self.blocked_since
+            self.blocked_since = None
+
+    def stop(self):
+        """ Machine has halted.  Stop the clock. """
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    def report(self):
+        """ Return the profile as a dict """
+        elapsed = (self.end_time or time.perf_counter()) - self.start_time
+        running = elapsed - self.input_wait
+        return {
+            'instructions': self.instructions,
+            'elapsed': elapsed,
+            'input_wait': self.input_wait,
+            'instructions_per_second': self.instructions / running if running > 0 else 0.0,
+            'op_codes': dict(self.op_codes.most_common()),
+            'hot_addresses': self.addresses.most_common(20),
+        }
+
+    def histogram(self, count=20, width=50):
+        """ Return a text histogram of the most executed addresses """
+        hot = self.addresses.most_common(count)
+        if not hot:
+            return ''
+        top = hot[0][1]
+        lines = []
+        for address, executed in hot:
+            bar = '#' * max(1, executed * width // top)
+            lines.append(f'{address:>8} {executed:>10} {bar}')
+        return '\n'.join(lines)
+
+class AsciiOutput():
+    """ Output from IntCodeComputer.read_ascii().
+        text = the ASCII outputs as a str, values = the outputs that are not ASCII
+    """
+    def __init__(self, text, values):
+        self.text = text
+        self.values = values
+
+    def lines(self):
+        """ The text split into lines """
+        return self.text.splitlines()
+
+    def frames(self):
+        """ The text split into frames at blank lines.  Each frame is a list of lines. """
+        return [frame.splitlines() for frame in self.text.split('\n\n') if frame.strip('\n')]
+
 class IntCodeComputer():
     """ Class for managing int code computers """
-    def __init__(self, program, input_data=None, output_data=None):
+    def __init__(self, program, input_data=None, output_data=None, memory_model=DictMemory,
+                 compiled=False, profile=False, output_sink=OUTPUT_BOTH, peephole=False):
+    # pylint: disable=too-many-arguments
 
         # Copy the list here so that we have a local copy
-        self.program = dict(enumerate(program))
+        self.set_memory(memory_model(program))
         self.instruction_pointer = 0
         self.relative_base = 0
 
-        if isinstance(input_data, queue.Queue):
+        if isinstance(input_data, (Channel, queue.Queue)):
             self.input = input_data
         else:
-            self.input = queue.Queue()
-            if input_data is None:
-                input_data = []
-            for inp in input_data:
-                self.input.put(inp)
+            self.input = Channel(input_data or [])
 
-        if isinstance(output_data, queue.Queue):
+        if isinstance(output_data, (Channel, queue.Queue)):
             self.output = output_data
         else:
-            self.output = queue.Queue()
+            self.output = Channel()
 
         self.halt_status = False
         self.waiting = False
         self.result = []
 
+        # Function called with each output value.  output_sink is kept so
+        # snapshots can rebuild the same kind of machine.
+        self.output_sink = output_sink
+        self.emit = self.output_emitter(output_sink)
+
+        # Instructions retired so far
+        self.instruction_count = 0
+
+        # Optional recorder for I/O events (see int_code_trace)
+        self.trace = None
+
+        # Set while we are blocked on an empty input queue or have halted.
+        # The lock makes the empty check + set atomic with send()
+        self.awaiting_input = threading.Event()
+        self.input_lock = threading.Lock()
+
+        # Decoded instructions.  key = address of op-code,
+        # val = (op_code, arg1 mode, arg2 mode, arg3 mode, size)
+        self.decode_cache = {}
+        # key = address, val = set of cached instruction addresses that cover it
+        self.decode_cover = {}
+
+        # Fuse common instruction pairs (see match_idiom()).  fusing is
+        # whether the decode cache currently holds fused instructions.
+        self.peephole = peephole
+        self.fusing = False
+
+        # Compiled code (int_code_compiler.CompiledProgram) or None to interpret
+        self.compiled = None
+
+        # Functions called with (address, op_code) before each instruction
+        # in the traced loop
+        self.hooks = []
+
+        # ExecutionProfile when profiling
+        self.profile = None
+        if profile:
+            self.enable_profiling()
+
+        if compiled:
+            self.compile()
+
+    def output_emitter(self, output_sink):
+        """ Return the function op-code 4 uses to pass on each output.  The
+            functions do not refer back to the machine so it is freed as soon as
+            it is no longer used (no reference cycle).
+        """
+        if output_sink == OUTPUT_BOTH:
+            put = self.output.put
+            append = self.result.append
+            def emit(value):
+                put(value)
+                append(value)
+            return emit
+
+        if output_sink == OUTPUT_QUEUE:
+            return self.output.put
+
+        if output_sink == OUTPUT_LIST:
+            return self.result.append
+
+        if isinstance(output_sink, int) and not isinstance(output_sink, bool) and output_sink > 0:
+            self.result = collections.deque(maxlen=output_sink)
+            return self.result.append
+
+        if callable(output_sink):
+            return output_sink
+
+        raise ValueError(f'Unknown output sink {output_sink!r}')
+
+    def enable_profiling(self):
+        """ Start counting instructions.  Returns the ExecutionProfile. """
+        if self.compiled is not None:
+            self.decompile()
+        self.profile = ExecutionProfile()
+        self.add_hook(self.profile.record)
+        return self.profile
+
+    def add_hook(self, hook):
+        """ Call hook(address, op_code) before every instruction.
+            Takes effect the next time the machine starts running.
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """ Stop calling the given hook """
+        self.hooks.remove(hook)
+
+    def select_step(self):
+        """ Pick the function that executes one instruction.
+
+            Returns (step function, True if compiled code can be used)
+        """
+        hooks = list(self.hooks)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            hooks.append(log_instruction)
+
+        self.set_fusion(self.peephole and not hooks)
+
+        if not hooks:
+            return self.process_instruction, self.compiled is not None
+
+        def traced_instruction():
+            pointer = self.instruction_pointer
+            op_code = self.decode_instruction(pointer)[0]
+            for hook in hooks:
+                hook(pointer, op_code)
+            self.process_instruction()
+
+        return traced_instruction, False
+
+    def set_fusion(self, enabled):
+        """ Turn instruction fusion on or off.  The decode cache is dropped
+            if it changes so we never mix fused and plain entries.
+        """
+        if enabled != self.fusing:
+            self.fusing = enabled
+            self.decode_cache.clear()
+            self.decode_cover.clear()
+
+    def compile(self):
+        """ Compile the program from the current instruction pointer onwards.
+            Programs that write over their own op-codes are not compiled.
+        """
+        if self.profile is not None:
+            LOGGER.debug('Profiling.  Not compiling.')
+            return
+        # pylint: disable=import-outside-toplevel
+        import int_code_compiler
+        import int_code_disassembler
+
+        analysis = int_code_disassembler.analyse(self.program, {0, self.instruction_pointer})
+        if analysis.patched_op_codes:
+            LOGGER.debug('Program writes to op-codes %s.  Not compiling.',
+                         sorted(analysis.patched_op_codes))
+            return
+        self.compiled = int_code_compiler.CompiledProgram(self.program, self.instruction_pointer,
+                                                          volatile=analysis.patched_args)
+
+    def decompile(self):
+        """ Drop the compiled code and go back to interpreting everything.
+            Compiled code writes straight to memory so the decode cache may be stale.
+        """
+        LOGGER.debug('Compiled code modified at %s. Interpreting.', self.instruction_pointer)
+        self.compiled = None
+        self.decode_cache.clear()
+        self.decode_cover.clear()
+
+    def run_compiled(self, limit=None):
+        """ Run compiled code from the current instruction pointer until we reach
+            an instruction that has to be interpreted or a block that would take
+            us past limit more instructions
+        """
+        self.instruction_pointer, self.relative_base, modified, count = self.compiled.run(
+            self.instruction_pointer, self.relative_base, limit)
+        self.instruction_count += count
+        if modified:
+            self.decompile()
+
+    def snapshot(self):
+        """ Capture the machine state.  Memory is copied with copy() so for
+            PagedMemory this only costs the page table.
+
+            Only take a snapshot while the machine is not executing
+            (not started, halted or blocked waiting for input).
+        """
+        return {
+            'memory': self.program.copy(),
+            'instruction_pointer': self.instruction_pointer,
+            'relative_base': self.relative_base,
+            'input': list(self.input.queue),
+            'output': list(self.output.queue),
+            'result': list(self.result),
+            'halt_status': self.halt_status,
+            'instruction_count': self.instruction_count,
+            'compiled': self.compiled is not None,
+            'peephole': self.peephole,
+            'output_sink': self.output_sink,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, output_sink=None):
+        """ Build a new machine from a snapshot.  The snapshot memory is copied
+            again so the same snapshot can be used for many machines.
+            output_sink replaces the one in the snapshot (needed if that was
+            a callable that could not be saved to a checkpoint).
+        """
+        if output_sink is None:
+            output_sink = snapshot.get('output_sink', OUTPUT_BOTH)
+        if output_sink is None:
+            raise ValueError('Snapshot has no output sink, pass one in')
+
+        comp = cls([], snapshot['input'], output_sink=output_sink)
+        comp.set_memory(snapshot['memory'].copy())
+        comp.instruction_pointer = snapshot['instruction_pointer']
+        comp.relative_base = snapshot['relative_base']
+        for out in snapshot['output']:
+            comp.output.put(out)
+        comp.result.extend(snapshot['result'])
+        comp.halt_status = snapshot['halt_status']
+        comp.instruction_count = snapshot.get('instruction_count', 0)
+        comp.peephole = snapshot.get('peephole', False)
+        if snapshot.get('compiled'):
+            comp.compile()
+        return comp
+
+    def fork(self):
+        """ Return a new machine with a copy of this machines state.
+            Input and output queues are new queues holding the same pending values.
+            Use resume() to continue running the copy.
+        """
+        return self.from_snapshot(self.snapshot())
+
+    def save_checkpoint(self, filename):
+        """ Save the machine state to a file (see int_code_checkpoint) """
+        import int_code_checkpoint # pylint: disable=import-outside-toplevel
+        int_code_checkpoint.save_checkpoint(self, filename)
+
+    @classmethod
+    def load_checkpoint(cls, filename, output_sink=None):
+        """ Build a machine from a file written by save_checkpoint() """
+        import int_code_checkpoint # pylint: disable=import-outside-toplevel
+        return int_code_checkpoint.load_checkpoint(filename, output_sink)
+
+    def send(self, *values):
+        """ Put values on the input queue and clear awaiting_input so a
+            following wait_for_input() waits for the next input request
+        """
+        with self.input_lock:
+            self.awaiting_input.clear()
+            put_all(self.input, values)
+
+    def send_ascii(self, text):
+        """ Send a str or bytes as ASCII codes """
+        if isinstance(text, str):
+            text = text.encode('ascii')
+        self.send(*text)
+
+    def read_ascii(self):
+        """ Take everything waiting on the output queue.  Returns an AsciiOutput. """
+        values = take_all(self.output)
+        text = bytes(value for value in values if 0 <= value <= ASCII_MAX).decode('ascii')
+        return AsciiOutput(text, [value for value in values if not 0 <= value <= ASCII_MAX])
+
+    def wait_for_input(self, timeout=None):
+        """ Block until the machine wants input that has not been given
+            yet or has halted.  Returns False if we timed out.
+        """
+        return self.awaiting_input.wait(timeout)
+
+    def decode_instruction(self, address):
+        """ Decode the instruction at the given address.
+
+            Returns (op_code, arg1 mode, arg2 mode, arg3 mode, size).  Valid
+            instructions are cached so we only do the decode once.  Unknown
+            op-codes are returned with op_code = None and are never cached.
+
+            When fusing, a run of instructions where each pair is an idiom that
+            match_idiom() recognises is returned as
+            (FUSED, tuple of decodes, tuple of idioms, None, total size).
+        """
+        decoded = self.decode_cache.get(address)
+        if decoded is not None:
+            return decoded
+
+        decoded = decode_op_code(self.program.get(address, 0))
+        op_code, _, _, _, size = decoded
+        if op_code is None:
+            return decoded
+
+        if self.fusing and op_code in (1, 7, 8, 9):
+            instructions = [decoded]
+            idioms = []
+            start = address
+            while len(instructions) < MAX_FUSED:
+                following = decode_op_code(self.program.get(start + decoded[4], 0))
+                idiom = match_idiom(self.program, start, decoded, following)
+                if idiom is None:
+                    break
+                instructions.append(following)
+                idioms.append(idiom)
+                start += decoded[4]
+                size += following[4]
+                decoded = following
+
+            if idioms:
+                decoded = (FUSED, tuple(instructions), tuple(idioms), None, size)
+            else:
+                decoded = instructions[0]
+
+        self.decode_cache[address] = decoded
+        for addr in range(address, address + size):
+            self.decode_cover.setdefault(addr, set()).add(address)
+
+        return decoded
+
+    def write_memory(self, address, value):
+        """ Write value to the given address and drop any cached decode
+            for instructions that include that address
+        """
+        dense = self.dense
+        if dense is not None and 0 <= address < len(dense):
+            dense[address] = value
+        else:
+            self.program[address] = value
+
+        if (self.compiled is not None and address in self.compiled.code and
+                self.compiled.code_written(address)):
+            self.decompile()
+
+        if address in self.decode_cover:
+            for start in self.decode_cover.pop(address):
+                _, _, _, _, size = self.decode_cache.pop(start)
+                for addr in range(start, start + size):
+                    if addr != address:
+                        self.decode_cover[addr].discard(start)
+                        if not self.decode_cover[addr]:
+                            del self.decode_cover[addr]
+
+    def set_memory(self, memory):
+        """ Use memory as the program memory.  With DenseMemory reads and writes
+            inside the dense list index it directly.
+        """
+        self.program = memory
+        self.dense = getattr(memory, 'dense', None)
+
     def get_arg(self, pointer, address_mode):
         """ Get the argument from either the immediate value or from the location
             pointed to (position mode, relative mode)
         """
+        dense = self.dense
+        if dense is not None:
+            size = len(dense)
+            if pointer < size:
+                word = dense[pointer]
+                if address_mode == I_MODE:
+                    return word
+                if address_mode == R_MODE:
+                    word += self.relative_base
+                if 0 <= word < size:
+                    return dense[word]
+
         if address_mode == I_MODE:
             arg = self.program.get(pointer, 0)
         elif address_mode == P_MODE:
@@ -108,10 +941,16 @@ class IntCodeComputer():
     def get_result_address(self, pointer, address_mode):
         """ Get the appropriate result address depending on the address mode
         """
+        dense = self.dense
+        if dense is not None and pointer < len(dense):
+            word = dense[pointer]
+        else:
+            word = self.program.get(pointer, 0)
+
         if address_mode == P_MODE:
-            result_address = self.program.get(pointer, 0)
+            result_address = word
         elif address_mode == R_MODE:
-            result_address = self.program.get(pointer, 0) + self.relative_base
+            result_address = word + self.relative_base
         else:
             result_address = None
         return result_address
@@ -147,106 +986,453 @@ class IntCodeComputer():
             08 = Equals.  Size = 4 fields
             09 = Set relative base
 
-            Pad the op-code with zeros to make it 5 chars
+            Op-code and arg modes come from decode_instruction() so the
+            string decode is only done once per instruction address.
 
         """
-        full_op_code = str(self.program.get(self.instruction_pointer, 0)).zfill(5)
-        op_code = full_op_code[-2:]
-
-        LOGGER.debug((self.instruction_pointer, op_code))
+        pointer = self.instruction_pointer
+        op_code, mode_1, mode_2, mode_3, size = self.decode_instruction(pointer)
 
+        self.instruction_count += 1
         self.halt_status = False
-        exit_reason = ''
 
-        if op_code == '99':
-            exit_reason = 'Halt OP code.  Halting.'
+        # Halt
+        if op_code == 99:
             self.halt_status = True
-            LOGGER.debug(exit_reason)
-
-        elif op_code in ['01', '02', '03', '04', '05', '06', '07', '08', '09']:
-            # Either Mode 0 or Mode 1 so here we use the function to always return the value
-            arg1 = self.get_arg(self.instruction_pointer + 1, int(full_op_code[2]))
-            arg2 = self.get_arg(self.instruction_pointer + 2, int(full_op_code[1]))
-            result_address = self.get_result_address(self.instruction_pointer + 3,
-                                                     int(full_op_code[0]))
-
-            # Add
-            if op_code == '01':
-                self.program[result_address] = arg1 + arg2
-                self.instruction_pointer += 4
-
-            # Multiply
-            elif op_code == '02':
-                self.program[result_address] = arg1 * arg2
-                self.instruction_pointer += 4
-
-            # Input
-            elif op_code == '03':
-                # Input uses arg 1 for result address so re-calc the result address
-                result_address = self.get_result_address(self.instruction_pointer + 1,
-                                                         int(full_op_code[2]))
-
-                while self.input.empty():
-                    time.sleep(0.001)
+            self.awaiting_input.set()
+            if self.profile is not None:
+                self.profile.stop()
+
+        # Add
+        elif op_code == 1:
+            self.write_memory(self.get_result_address(pointer + 3, mode_3),
+                              self.get_arg(pointer + 1, mode_1) + self.get_arg(pointer + 2, mode_2))
+            self.instruction_pointer += 4
+
+        # Multiply
+        elif op_code == 2:
+            self.write_memory(self.get_result_address(pointer + 3, mode_3),
+                              self.get_arg(pointer + 1, mode_1) * self.get_arg(pointer + 2, mode_2))
+            self.instruction_pointer += 4
+
+        # Input
+        elif op_code == 3:
+            # Input uses arg 1 for result address
+            result_address = self.get_result_address(pointer + 1, mode_1)
+
+            with self.input_lock:
+                if self.input.empty():
                     self.waiting = True
+                    self.awaiting_input.set()
+                    if self.profile is not None:
+                        self.profile.block()
+
+            value = self.input.get()
+            self.waiting = False
+            self.awaiting_input.clear()
+            if self.profile is not None:
+                self.profile.unblock()
 
-                self.waiting = False
+            self.write_memory(result_address, value)
+            if self.trace is not None:
+                self.trace.input(self.instruction_count, value)
+            self.instruction_pointer += 2
 
-                self.program[result_address] = self.input.get()
-                LOGGER.debug(self.program.get(result_address, 0))
-                self.instruction_pointer += 2
+        # Output
+        elif op_code == 4:
+            arg1 = self.get_arg(pointer + 1, mode_1)
+            self.emit(arg1)
+            if self.trace is not None:
+                self.trace.output(self.instruction_count, arg1)
+            self.instruction_pointer += 2
 
-            # Output
-            elif op_code == '04':
-                self.output.put(arg1)
-                self.result.append(arg1)
-                LOGGER.debug(arg1)
-                self.instruction_pointer += 2
+        # Jump if true
+        elif op_code == 5:
+            if self.get_arg(pointer + 1, mode_1):
+                self.instruction_pointer = self.get_arg(pointer + 2, mode_2)
+            else:
+                self.instruction_pointer += 3
 
-            # Jump if true
-            elif op_code == '05':
-                self.instruction_pointer = arg2 if arg1 else self.instruction_pointer + 3
+        # Jump if false
+        elif op_code == 6:
+            if self.get_arg(pointer + 1, mode_1) == 0:
+                self.instruction_pointer = self.get_arg(pointer + 2, mode_2)
+            else:
+                self.instruction_pointer += 3
 
-            # Jump if false
-            elif op_code == '06':
-                self.instruction_pointer = arg2 if arg1 == 0 else self.instruction_pointer + 3
+        # Less than
+        elif op_code == 7:
+            arg1 = self.get_arg(pointer + 1, mode_1)
+            arg2 = self.get_arg(pointer + 2, mode_2)
+            self.write_memory(self.get_result_address(pointer + 3, mode_3),
+                              1 if arg1 < arg2 else 0)
+            self.instruction_pointer += 4
 
-            # Less than
-            elif op_code == '07':
-                self.program[result_address] = 1 if arg1 < arg2 else 0
-                self.instruction_pointer += 4
+        # Equals
+        elif op_code == 8:
+            arg1 = self.get_arg(pointer + 1, mode_1)
+            arg2 = self.get_arg(pointer + 2, mode_2)
+            self.write_memory(self.get_result_address(pointer + 3, mode_3),
+                              1 if arg1 == arg2 else 0)
+            self.instruction_pointer += 4
 
-            # Equals
-            elif op_code == '08':
-                self.program[result_address] = 1 if arg1 == arg2 else 0
-                self.instruction_pointer += 4
+        # Adjust relative mode base
+        elif op_code == 9:
+            self.relative_base = self.relative_base + self.get_arg(pointer + 1, mode_1)
+            self.instruction_pointer += 2
 
-            # Adjust relative mode base
-            elif op_code == '09':
-                self.relative_base = self.relative_base + arg1
-                self.instruction_pointer += 2
+        # Fused instructions.  mode_1 holds the instruction decodes.
+        elif op_code == FUSED:
+            self.process_fused(mode_1, size)
 
+        # Unknown op_code. Halting operation.
         else:
-            exit_reason = 'Unknown op_code. Halting operation.'
             self.halt_status = True
-            LOGGER.debug(exit_reason)
+            self.awaiting_input.set()
+            if self.profile is not None:
+                self.profile.stop()
+
+    def process_fused(self, instructions, size):
+        """ Run a fused instruction (see decode_instruction()).  Only 01, 02, 07, 08
+            and 09 plus a final 05 / 06 get fused so there is no I/O or halt to handle.
+            Args are read inline rather than through get_arg() to save the calls and
+            write_memory() is only used for writes that may hit code.  With
+            DenseMemory reads and writes inside the list index it directly
+            (for other memory dense is empty so everything goes through get()).
+        """
+        memory = self.program
+        get = memory.get
+        dense = self.dense if self.dense is not None else ()
+        size_dense = len(dense)
+        decode_cover = self.decode_cover
+        pointer = self.instruction_pointer
+        end = pointer + size
+        relative_base = self.relative_base
+        count = 0
+
+        for op_code, mode_1, mode_2, mode_3, length in instructions:
+            count += 1
+            word = dense[pointer + 1] if pointer + 1 < size_dense else get(pointer + 1, 0)
+            if mode_1 == P_MODE:
+                arg1 = dense[word] if 0 <= word < size_dense else get(word, 0)
+            elif mode_1 == R_MODE:
+                word += relative_base
+                arg1 = dense[word] if 0 <= word < size_dense else get(word, 0)
+            else:
+                arg1 = word
+
+            if op_code == 9:
+                relative_base += arg1
+                pointer += 2
+                continue
+
+            word = dense[pointer + 2] if pointer + 2 < size_dense else get(pointer + 2, 0)
+            if mode_2 == P_MODE:
+                arg2 = dense[word] if 0 <= word < size_dense else get(word, 0)
+            elif mode_2 == R_MODE:
+                word += relative_base
+                arg2 = dense[word] if 0 <= word < size_dense else get(word, 0)
+            else:
+                arg2 = word
+
+            if op_code == 5 or op_code == 6:
+                # Jumps are always last
+                pointer = arg2 if (arg1 != 0) == (op_code == 5) else pointer + 3
+                break
+
+            if op_code == 1:
+                value = arg1 + arg2
+            elif op_code == 2:
+                value = arg1 * arg2
+            elif op_code == 7:
+                value = 1 if arg1 < arg2 else 0
+            else:
+                value = 1 if arg1 == arg2 else 0
+
+            address = dense[pointer + 3] if pointer + 3 < size_dense else get(pointer + 3, 0)
+            if mode_3 == R_MODE:
+                address += relative_base
+            if address in decode_cover or self.compiled is not None:
+                self.write_memory(address, value)
+            elif 0 <= address < size_dense:
+                dense[address] = value
+            else:
+                # May grow the dense list
+                memory[address] = value
+                size_dense = len(dense)
+            pointer += length
+
+            if pointer <= address < end:
+                # We have just changed one of the instructions still to run
+                # so stop and let it be decoded again
+                break
+
+        # process_instruction() has counted one instruction already
+        self.instruction_count += count - 1
+        self.instruction_pointer = pointer
+        self.relative_base = relative_base
+
+    def step_until_io(self):
+        """ Run in the calling thread until the machine halts, produces an output
+            or reaches an input instruction with no input queued.  An input
+            instruction is not executed until there is something to read.
+
+            Returns HALTED, OUTPUT_READY or NEED_INPUT
+        """
+        return self.run()
+
+    def run(self, max_steps=None):
+        """ Run in the calling thread from the current instruction pointer for
+            at most max_steps instructions (no limit if None).  Otherwise stops as
+            step_until_io() does, so call it again to carry on.
+
+            Returns HALTED, OUTPUT_READY, NEED_INPUT or BUDGET_EXHAUSTED
+        """
+        step, use_compiled = self.select_step()
+        end = None if max_steps is None else self.instruction_count + max_steps
+        remaining = None
+
+        while not self.halt_status:
+            if end is not None:
+                remaining = end - self.instruction_count
+                if remaining <= 0:
+                    return BUDGET_EXHAUSTED
+
+            if use_compiled and self.compiled is not None:
+                self.run_compiled(remaining)
+                if end is not None:
+                    if self.compiled is not None and self.compiled.blocks.get(
+                            self.instruction_pointer) is not None:
+                        # Stopped for the budget.  Interpret what is left of it.
+                        use_compiled = False
+                    remaining = end - self.instruction_count
+                    if remaining <= 0:
+                        return BUDGET_EXHAUSTED
+
+            decoded = self.decode_instruction(self.instruction_pointer)
+            op_code = decoded[0]
+
+            if op_code == 3 and self.input.empty():
+                self.waiting = True
+                self.awaiting_input.set()
+                if self.profile is not None:
+                    self.profile.block()
+                return NEED_INPUT
+
+            if op_code == FUSED and remaining is not None and len(decoded[1]) > remaining:
+                # Only run as many of the fused instructions as the budget allows
+                instructions = decoded[1][:remaining]
+                self.instruction_count += 1
+                self.process_fused(instructions, sum(length for *_, length in instructions))
+            else:
+                step()
+
+            if op_code == 4:
+                return OUTPUT_READY
+
+        return HALTED
+
+    def run_until_input(self):
+        """ Run in the calling thread until we halt or need input.
+            Outputs are left on the output queue.
+
+            Returns HALTED or NEED_INPUT
+        """
+        status = self.step_until_io()
+        while status == OUTPUT_READY:
+            status = self.step_until_io()
+        return status
 
     def run_program(self):
         """ Run the given program """
         self.instruction_pointer = 0
+        self.resume()
 
-        while not self.halt_status:
-            self.process_instruction()
+    def resume(self):
+        """ Run from the current instruction pointer until we halt """
+        step, use_compiled = self.select_step()
+
+        if use_compiled:
+            while not self.halt_status:
+                if self.compiled is not None:
+                    self.run_compiled()
+                step()
+        else:
+            while not self.halt_status:
+                step()
         LOGGER.debug('Exit thread')
 
-def run_computer(program, input_data):
+class Network():
+    """ A set of machines run round robin in the calling thread.
+        connect() routes the outputs of one machine to the input of another.
+        Outputs of machines with no connections stay on their output queue.
+    """
+    def __init__(self, machines=None):
+        self.machines = list(machines or [])
+        # key = machine index, val = list of machine indexes its outputs go to
+        self.routes = {}
+
+    @classmethod
+    def ring(cls, machines):
+        """ Network where each machine feeds the next and the last feeds the first """
+        network = cls(machines)
+        for index in range(len(network.machines)):
+            network.connect(index, (index + 1) % len(network.machines))
+        return network
+
+    def add(self, machine):
+        """ Add a machine.  Returns its index. """
+        self.machines.append(machine)
+        return len(self.machines) - 1
+
+    def connect(self, source, destination):
+        """ Send the outputs of machine source to the input of machine destination """
+        self.routes.setdefault(source, []).append(destination)
+
+    def run(self):
+        """ Run the machines until they have all halted or are all waiting for input.
+            Machines get a turn in index order to start with and then in the order
+            they are given input so runs are repeatable.
+
+            Returns HALTED or IDLE
+        """
+        ready = collections.deque(range(len(self.machines)))
+        scheduled = set(ready)
+
+        while ready:
+            index = ready.popleft()
+            scheduled.discard(index)
+            machine = self.machines[index]
+            if machine.halt_status:
+                continue
+
+            machine.run_until_input()
+
+            destinations = self.routes.get(index)
+            if not destinations:
+                continue
+            while not machine.output.empty():
+                value = machine.output.get()
+                for destination in destinations:
+                    self.machines[destination].send(value)
+                    if destination not in scheduled:
+                        ready.append(destination)
+                        scheduled.add(destination)
+
+        if all(machine.halt_status for machine in self.machines):
+            return HALTED
+        return IDLE
+
+def run_computer(program, input_data, memory_model=DictMemory, compiled=False):
     """ run basic int code computer tests """
 
-    # Build and run the computer.
-    comp = IntCodeComputer(program, input_data)
+    # Build and run the computer.  We only want the result list.
+    comp = IntCodeComputer(program, input_data, memory_model=memory_model, compiled=compiled,
+                           output_sink=OUTPUT_LIST)
     comp.run_program()
     return comp.result
 
+class RunCache():
+    """ Cache of outputs for runs that are a pure function of program + input.
+
+        max_size = number of results kept in memory (least recently used are dropped)
+        filename = optional shelve file so results survive between runs
+    """
+    def __init__(self, max_size=100000, filename=None):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.store = shelve.open(filename) if filename else None
+
+        # key = program contents, val = hash.  So we only hash each program once.
+        # Only the last PROGRAM_HASH_LIMIT programs are kept.
+        self.program_hashes = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def program_hash(self, program):
+        """ Content hash for the program """
+        contents = tuple(program)
+        digest = self.program_hashes.get(contents)
+        if digest is None:
+            digest = hashlib.sha256(repr(contents).encode()).hexdigest()
+            self.program_hashes[contents] = digest
+            if len(self.program_hashes) > PROGRAM_HASH_LIMIT:
+                self.program_hashes.popitem(last=False)
+        else:
+            self.program_hashes.move_to_end(contents)
+        return digest
+
+    def run(self, program, input_data=None):
+        """ Return the outputs from running program with input_data.  Only runs
+            the program if we have not seen this program + input before.
+        """
+        input_data = tuple(input_data or [])
+        key = f'{self.program_hash(program)}:{input_data}'
+
+        result = self.entries.get(key)
+        if result is None and self.store is not None:
+            result = self.store.get(key)
+
+        if result is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            comp = IntCodeComputer(program, input_data, output_sink=OUTPUT_LIST)
+            if comp.run_until_input() != HALTED:
+                raise ValueError('Program wants more input than it was given')
+            result = tuple(comp.result)
+            if self.store is not None:
+                self.store[key] = result
+
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return list(result)
+
+    def close(self):
+        """ Close the disk store """
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+RUN_CACHE = RunCache()
+
+def cached_run(program, input_data=None):
+    """ Run the program through the module level RunCache """
+    return RUN_CACHE.run(program, input_data)
+
+# Program and memory model for this run_batch() worker process
+WORKER_PROGRAM = None
+WORKER_MEMORY_MODEL = DictMemory
+
+def init_batch_worker(program, memory_model):
+    """ Process pool initializer.  Keep the program for the life of the worker """
+    global WORKER_PROGRAM, WORKER_MEMORY_MODEL # pylint: disable=global-statement
+    WORKER_PROGRAM = program
+    WORKER_MEMORY_MODEL = memory_model
+
+def run_batch_job(input_data):
+    """ Run the worker program with the given input """
+    return run_computer(WORKER_PROGRAM, input_data, WORKER_MEMORY_MODEL)
+
+def run_batch(program, input_vectors, max_workers=None, memory_model=DictMemory):
+    """ Run the program once for each input vector on a pool of processes.
+        Returns the list of outputs for each run in the same order as input_vectors.
+    """
+    input_vectors = list(input_vectors)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    # Send jobs in chunks so we are not paying IPC for every tiny run
+    chunksize = max(1, len(input_vectors) // (max_workers * 4))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers,
+                                                initializer=init_batch_worker,
+                                                initargs=(list(program), memory_model)) as pool:
+        return list(pool.map(run_batch_job, input_vectors, chunksize=chunksize))
+
 def run_tests():
     """ Run test programs """
 
@@ -262,11 +1448,286 @@ def run_tests():
 
     assert run_computer(TEST_5, None) == [1219070632396864]
     assert run_computer(TEST_6, None) == [1125899906842624]
+    assert run_computer(TEST_7, None) == [7, 0]
 
-    program = load_data('day_5_data.txt')
+    program = load_data('day_05_data.txt')
     assert run_computer(program, input_data=[AC_UNIT_ID]) == [0, 0, 0, 0, 0, 0, 0, 0, 0, 6761139]
     assert run_computer(program, input_data=[TRC_UNIT_ID]) == [9217546]
 
+    # Dense memory.  Writes just past the end grow the list.  Writes further out go
+    # to the sparse dict and move into the list once it grows over them.
+    memory = DenseMemory([1, 2, 3])
+    size = len(memory.dense)
+    memory[size + 10] = 5
+    assert len(memory.dense) > size + 10 and not memory.sparse
+    far = len(memory.dense) + DENSE_GROW_LIMIT + 100
+    memory[far] = 6
+    assert memory.sparse == {far: 6} and memory.get(far) == 6
+    while len(memory.dense) <= far:
+        memory[len(memory.dense)] = 1
+    assert not memory.sparse and memory.dense[far] == 6 and memory[far] == 6
+
+    # Far out and negative addresses stay sparse
+    memory[1 << 40] = 7
+    memory[-3] = 8
+    assert memory.sparse == {1 << 40: 7, -3: 8}
+    assert memory.get(1 << 40) == 7 and memory.get(-3) == 8 and memory.get(-4) == 0
+    assert memory.get((1 << 40) + 1) == 0 and (1 << 40) in memory
+    copy = memory.copy()
+    copy[0] = 9
+    copy[1 << 40] = 10
+    assert memory[0] == 1 and memory[1 << 40] == 7
+
+    # Paged memory is copy on write.  Copies share pages until one side writes.
+    memory = PagedMemory(range(3 * PAGE_SIZE))
+    copy = memory.copy()
+    assert all(copy.pages[number] is memory.pages[number] for number in memory.pages)
+    copy[10] = -1
+    assert memory[10] == 10 and copy[10] == -1
+    assert copy.pages[0] is not memory.pages[0] and copy.pages[1] is memory.pages[1]
+    memory[PAGE_SIZE + 1] = -2
+    assert copy[PAGE_SIZE + 1] == PAGE_SIZE + 1 and copy.pages[1] is not memory.pages[1]
+    assert copy.pages[2] is memory.pages[2]
+
+    # Fork part way through a run.  Writes after the fork stay on their own side
+    # and both machines finish the same way as an unbroken run.
+    day_9 = load_data('day_09_data.txt')
+    expected = run_computer(day_9, [1])
+    for memory_model in (DictMemory, DenseMemory, PagedMemory):
+        comp = IntCodeComputer(day_9, [1], memory_model=memory_model)
+        assert comp.run(100) == BUDGET_EXHAUSTED
+        forked = comp.fork()
+        assert forked.snapshot()['instruction_pointer'] == comp.instruction_pointer
+        comp.program[5000] = 1
+        forked.program[5001] = 2
+        assert forked.program.get(5000, 0) == 0 and comp.program.get(5001, 0) == 0
+        for machine in (comp, forked):
+            assert machine.run() == OUTPUT_READY and machine.run() == HALTED
+            assert machine.result == expected
+        assert forked.instruction_count == comp.instruction_count
+
+    # Machines using dense memory (reads and writes index the list directly)
+    for test_program, input_data in [(TEST_4, None), (TEST_5, None), (TEST_7, None),
+                                     (program, [TRC_UNIT_ID]),
+                                     (load_data('day_09_data.txt'), [1])]:
+        assert (run_computer(test_program, input_data, DenseMemory) ==
+                run_computer(test_program, input_data))
+
+
+    # Day 7 feedback loop on a network
+    program = load_data('day_07_data.txt')
+    amps = [IntCodeComputer(program, [phase]) for phase in (5, 7, 6, 8, 9)]
+    amps[0].send(0)
+    assert Network.ring(amps).run() == HALTED
+    assert amps[-1].result[-1] == 5371621
+
+    # Nothing to give the machine so the network goes idle until we send it something
+    network = Network([IntCodeComputer(TEST_1)])
+    assert network.run() == IDLE
+    network.machines[0].send(1)
+    assert network.run() == HALTED and network.machines[0].result == [1]
+
+    # Output sinks
+    for output_sink, result, queued in [(OUTPUT_BOTH, [999], [999]),
+                                        (OUTPUT_QUEUE, [], [999]),
+                                        (OUTPUT_LIST, [999], [])]:
+        comp = IntCodeComputer(TEST_3, [7], output_sink=output_sink)
+        comp.run_program()
+        assert comp.result == result and take_all(comp.output) == queued
+
+    comp = IntCodeComputer(TEST_4, output_sink=3)
+    comp.run_program()
+    assert list(comp.result) == TEST_4[-3:] and comp.output.empty()
+
+    # Forks keep the sink
+    comp = IntCodeComputer(TEST_4, output_sink=3)
+    comp.run(20)
+    fork = comp.fork()
+    fork.resume()
+    assert fork.result.maxlen == 3 and list(fork.result) == TEST_4[-3:] and fork.output.empty()
+
+    outputs = []
+    comp = IntCodeComputer(TEST_4, output_sink=outputs.append)
+    comp.run_program()
+    assert outputs == TEST_4 and comp.result == [] and comp.output.empty()
+
+    for output_sink in (True, 0, -1, 'ring'):
+        try:
+            IntCodeComputer(TEST_1, output_sink=output_sink)
+            assert False, f'Expected ValueError for {output_sink!r}'
+        except ValueError:
+            pass
+
+    # A finished machine is freed straight away rather than by the cycle collector
+    gc.disable()
+    try:
+        comp = IntCodeComputer(TEST_3, [8])
+        comp.run_program()
+        freed = weakref.ref(comp)
+        del comp
+        assert freed() is None
+    finally:
+        gc.enable()
+
+    # Run cache.  Least recently used results are dropped, the disk store keeps
+    # them between caches and runs that block on input are errors.
+    cache = RunCache(max_size=2)
+    assert cache.run(TEST_3, [7]) == [999] and cache.run(TEST_3, [8]) == [1000]
+    assert cache.run(TEST_3, [7]) == [999] and (cache.hits, cache.misses) == (1, 2)
+    cache.run(TEST_3, [9])
+    assert len(cache.entries) == 2
+    cache.run(TEST_3, [8])
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'runs')
+        cache = RunCache(filename=filename)
+        assert cache.run(TEST_5) == [1219070632396864]
+        cache.close()
+        cache = RunCache(filename=filename)
+        assert cache.run(TEST_5) == [1219070632396864] and cache.hits == 1
+        cache.close()
+
+    try:
+        RunCache().run(TEST_3)
+        assert False, 'Expected ValueError'
+    except ValueError:
+        pass
+
+    cache = RunCache()
+    for value in range(PROGRAM_HASH_LIMIT + 3):
+        cache.run([104, value, 99])
+    assert len(cache.program_hashes) == PROGRAM_HASH_LIMIT
+
+    # Batch runs on a process pool come back in input order
+    day_19 = load_data('day_19_data.txt')
+    input_vectors = [[x, y] for y in range(8, 14) for x in range(4, 14)]
+    results = run_batch(day_19, input_vectors, max_workers=2)
+    assert results == [run_computer(day_19, input_data) for input_data in input_vectors]
+    assert 0 < sum(result[0] for result in results) < len(input_vectors)
+    assert run_batch(TEST_3, [[7], [8], [9]]) == [[999], [1000], [1001]]
+
+    # Driver thread talking to a machine blocked on op-code 3.  The event is set
+    # while the machine waits for input and when it halts.  send() clears it.
+    comp = IntCodeComputer([3, 11, 4, 11, 3, 11, 4, 11, 99, 0, 0, 0])
+    machine = threading.Thread(target=comp.run_program)
+    machine.start()
+    assert comp.wait_for_input(5) and comp.waiting and comp.result == []
+    comp.send(1)
+    assert comp.wait_for_input(5) and comp.waiting and comp.result == [1]
+    comp.send(2)
+    machine.join(5)
+    assert not machine.is_alive() and comp.halt_status and comp.result == [1, 2]
+    assert comp.awaiting_input.is_set() and comp.wait_for_input(0)
+
+    comp = IntCodeComputer(TEST_3)
+    comp.awaiting_input.set()
+    comp.send(8)
+    assert not comp.awaiting_input.is_set() and not comp.wait_for_input(0.01)
+
+    # Channel between two threads
+    channel = Channel()
+    reader = threading.Thread(target=lambda: channel.put_all([channel.get() for _ in range(3)]))
+    reader.start()
+    for value in range(3):
+        time.sleep(0.01)
+        channel.put(value)
+    reader.join()
+    assert channel.take_all() == [0, 1, 2] and channel.empty()
+
+    # Machines on a queue.Queue still work
+    inputs = queue.Queue()
+    comp = IntCodeComputer(TEST_3, inputs)
+    inputs.put(8)
+    comp.run_program()
+    assert comp.result == [1000] and take_all(comp.output) == [1000]
+
+    # Batches on other queues go through put() / get() so limits and ordering hold
+    inputs = queue.PriorityQueue()
+    put_all(inputs, [3, 1, 2])
+    assert take_all(inputs) == [1, 2, 3] and inputs.empty()
+    inputs = queue.Queue(maxsize=2)
+    writer = threading.Thread(target=lambda: put_all(inputs, range(5)))
+    writer.start()
+    values = []
+    while len(values) < 5:
+        values.append(inputs.get())
+        assert inputs.qsize() <= 2
+    writer.join()
+    assert values == list(range(5)) and inputs.unfinished_tasks == 5
+
+    # ASCII I/O.  Echo the input back then output a big number.
+    comp = IntCodeComputer([3, 100, 1008, 100, 0, 101, 1005, 101, 14, 4, 100, 1105, 1, 0,
+                            104, 1 << 40, 99], output_sink=OUTPUT_QUEUE)
+    comp.send_ascii('ab\n\nc\n')
+    comp.send(0)
+    comp.run_program()
+    output = comp.read_ascii()
+    assert output.text == 'ab\n\nc\n' and output.values == [1 << 40]
+    assert output.lines() == ['ab', '', 'c'] and output.frames() == [['ab'], ['c']]
+    assert comp.output.empty()
+
+    # Fused instructions give the same results and instruction counts.  Debug
+    # logging adds a hook, which turns fusion off, so it is off for these.
+    level = LOGGER.level
+    LOGGER.setLevel(logging.INFO)
+    try:
+        for test_program, input_data in [(TEST_3, [7]), (TEST_3, [8]), (TEST_4, None),
+                                         (TEST_7, None), (load_data('day_09_data.txt'), [1])]:
+            plain = IntCodeComputer(test_program, input_data)
+            plain.run_program()
+            for memory_model in (DictMemory, DenseMemory):
+                comp = IntCodeComputer(test_program, input_data, memory_model=memory_model,
+                                       peephole=True)
+                comp.run_program()
+                assert comp.fusing
+                assert comp.result == plain.result
+                assert comp.instruction_count == plain.instruction_count
+
+                # The programs with loops really did run fused instructions
+                if test_program not in (TEST_3, TEST_7):
+                    assert any(entry[0] == FUSED for entry in comp.decode_cache.values())
+
+        # Instruction budget.  Same results however the run is sliced up, including
+        # budgets that end part way through a fused instruction or compiled block.
+        program = load_data('day_09_data.txt')
+        plain = IntCodeComputer(program, [2])
+        plain.run_program()
+        for max_steps, peephole, compiled in [(1, True, False), (3, True, False),
+                                              (100, True, False), (7, False, True),
+                                              (100000, False, False)]:
+            comp = IntCodeComputer(program, [2], peephole=peephole, compiled=compiled)
+            status = comp.run(max_steps)
+            while status != HALTED:
+                count = comp.instruction_count
+                status = comp.run(max_steps)
+                assert comp.instruction_count - count <= max_steps
+                assert status != BUDGET_EXHAUSTED or comp.instruction_count == count + max_steps
+            assert comp.fusing == peephole and (comp.compiled is not None) == compiled
+            assert comp.result == plain.result
+            assert comp.instruction_count == plain.instruction_count
+
+        # A one instruction budget runs the first instruction of a fused one
+        comp = IntCodeComputer(TEST_4, peephole=True)
+        plain = IntCodeComputer(TEST_4)
+        while comp.run(1) != HALTED:
+            plain.run(1)
+            assert (comp.instruction_pointer, comp.instruction_count, dict(comp.program.items())) == \
+                   (plain.instruction_pointer, plain.instruction_count, dict(plain.program.items()))
+        assert comp.decode_instruction(4)[0] == FUSED and comp.result == TEST_4
+    finally:
+        LOGGER.setLevel(level)
+
+    comp = IntCodeComputer(TEST_3)
+    assert comp.run(0) == BUDGET_EXHAUSTED and comp.run(5) == NEED_INPUT
+    comp.send(9)
+    assert comp.run(50) == OUTPUT_READY and comp.run(50) == HALTED and comp.result == [1001]
+
+    comp = IntCodeComputer(TEST_4, peephole=True)
+    comp.set_fusion(True)
+    assert comp.decode_instruction(4)[2] == (IDIOM_ADD_COMPARE, IDIOM_COMPARE_JUMP)
+    assert comp.decode_instruction(8)[2] == (IDIOM_COMPARE_JUMP,)
+    assert comp.decode_instruction(0)[0] == 9
 
     LOGGER.info('Instruction Computer: all tests pass')
 
@@ -0,0 +1,371 @@
+'''
+Advent of Code 2019
+
+Static disassembler for int code images
+
+analyse(program) walks the code reachable from address 0 without running it and
+returns a Disassembly that gives:
+    - each address as an op-code, an instruction argument or data
+    - the basic blocks and jump targets
+    - the addresses the program writes to, so we know up front if it patches its
+      own op-codes or instruction arguments
+
+Control flow follows fall through and immediate mode jump targets.  Jumps that read
+their target from memory (position / relative mode) cannot be followed.  The int
+code programs use those to return from functions, with the return address stored
+first (e.g. 21101, 0, 942, 0 then 1105, 1, 922), so if a program has any we also
+walk from the constants it stores that look like code: a run of valid instructions
+ending in a halt, an unconditional jump or code we already know about.  Constants
+that are data pointers usually run into an invalid op-code quickly.
+
+Writes to a position mode address are known statically.  Relative mode writes (the
+stack) and writes through an argument the program patches can go anywhere and are
+listed in dynamic_writes.  We assume they stay out of the program image.
+
+The programs have conditional jumps on locations they never write to (so the jump
+is never taken) and following those finds junk code.  So a position mode condition
+is treated as a constant unless the code we have found writes to it.  We start
+assuming nothing is written and walk again with the written addresses from the last
+walk until they stop changing.
+
+Usage: print(analyse(program).listing())
+
+'''
+
+import logging
+
+import int_code_computer as icc
+
+LOGGER = logging.getLogger(__name__)
+
+# Address classes
+OP_CODE = 'op code'
+ARGUMENT = 'argument'
+DATA = 'data'
+
+MNEMONICS = {1: 'add', 2: 'mul', 3: 'in', 4: 'out', 5: 'jnz', 6: 'jz',
+             7: 'lt', 8: 'eq', 9: 'arb', 99: 'halt'}
+
+# Op-codes that write to their last argument
+WRITE_OP_CODES = [1, 2, 3, 7, 8]
+
+class Disassembly():
+    """ Static analysis of an int code image (see analyse()) """
+    def __init__(self, memory, size=None, variable=()):
+        self.memory = memory
+        self.size = size
+        # Addresses that are written (found by the previous walk).  Conditions
+        # read from anywhere else are constants.
+        self.variable = set(variable)
+
+        # key = op-code address, val = (op_code, arg modes, size)
+        self.instructions = {}
+        # Addresses we walked from.  0 plus any stored code pointers.
+        self.entries = set()
+        self.jump_targets = set()
+        # Jumps with a position / relative mode target
+        self.indirect_jumps = set()
+        # Addresses we reached that do not hold a valid instruction
+        self.invalid = set()
+        # Constants stored by the code (both args immediate).  Possible code pointers.
+        self.constants = set()
+        # Constants that do not look like code (see looks_like_code())
+        self.not_code = set()
+        # key = address of a position mode write, val = address it writes to
+        self.write_targets = {}
+        # Addresses written by position mode writes
+        self.written = set()
+        # Instructions that write to an address we cannot work out statically
+        self.dynamic_writes = set()
+        # (number of instructions, argument addresses) from the last arguments()
+        self.argument_cache = (0, set())
+
+    def walk(self, entry):
+        """ Follow the code from entry adding each instruction we reach """
+        self.entries.add(entry)
+        to_do = [entry]
+
+        while to_do:
+            address = to_do.pop()
+            while address >= 0 and address not in self.instructions:
+                op_code, mode_1, mode_2, mode_3, size = icc.decode_op_code(
+                    self.memory.get(address, 0))
+                modes = (mode_1, mode_2, mode_3)[:size - 1]
+                if op_code is None or any(mode not in (icc.P_MODE, icc.I_MODE, icc.R_MODE)
+                                          for mode in modes):
+                    self.invalid.add(address)
+                    break
+
+                self.instructions[address] = (op_code, modes, size)
+
+                if op_code in (1, 2) and modes[:2] == (icc.I_MODE, icc.I_MODE):
+                    arg1 = self.memory.get(address + 1, 0)
+                    arg2 = self.memory.get(address + 2, 0)
+                    self.constants.add(arg1 + arg2 if op_code == 1 else arg1 * arg2)
+
+                if op_code in WRITE_OP_CODES:
+                    if modes[-1] == icc.P_MODE:
+                        self.write_targets[address] = self.memory.get(address + size - 1, 0)
+                    else:
+                        self.dynamic_writes.add(address)
+
+                if op_code == 99:
+                    break
+
+                if op_code in (5, 6):
+                    always = never = False
+                    condition = self.condition(address + 1, modes[0])
+                    if condition is not None:
+                        jumps = bool(condition) == (op_code == 5)
+                        always, never = jumps, not jumps
+
+                    if never:
+                        pass
+                    elif modes[1] == icc.I_MODE and address + 2 not in self.variable:
+                        target = self.memory.get(address + 2, 0)
+                        self.jump_targets.add(target)
+                        to_do.append(target)
+                    else:
+                        # Target read from memory or patched by the program
+                        self.indirect_jumps.add(address)
+
+                    if always:
+                        break
+
+                address += size
+
+    def condition(self, address, mode):
+        """ Value of the jump condition arg at address if it is a constant else None """
+        word = self.memory.get(address, 0)
+        if address in self.variable:
+            return None
+        if mode == icc.I_MODE:
+            return word
+        if mode == icc.P_MODE and word not in self.variable:
+            return self.memory.get(word, 0)
+        return None
+
+    def code_pointers(self):
+        """ Constants the program stores (both args immediate) that point at a
+            valid instruction we have not reached yet
+        """
+        arguments = self.arguments()
+        pointers = set()
+        for value in self.constants:
+            if (value in self.instructions or value in self.invalid or value in self.not_code or
+                    value < 0 or (self.size is not None and value >= self.size)):
+                continue
+            if self.looks_like_code(value, arguments):
+                pointers.add(value)
+            else:
+                self.not_code.add(value)
+        return pointers
+
+    def looks_like_code(self, address, arguments):
+        """ True if the straight line code from address is all valid instructions
+            up to a halt, an unconditional jump or an instruction we already have
+        """
+        while address not in self.instructions:
+            if address in arguments:
+                return False
+            op_code, mode_1, _, _, size = icc.decode_op_code(self.memory.get(address, 0))
+            if op_code is None:
+                return False
+            if op_code == 99:
+                return True
+            if op_code in (5, 6):
+                condition = self.condition(address + 1, mode_1)
+                if condition is not None and bool(condition) == (op_code == 5):
+                    return True
+            address += size
+        return True
+
+    def finish(self):
+        """ Work out the written addresses.  A write whose result address is
+            patched by another write is dynamic and its static target is ignored.
+        """
+        targets = set(self.write_targets.values())
+        for address in self.write_targets:
+            if address + self.instructions[address][2] - 1 in targets:
+                self.dynamic_writes.add(address)
+
+        self.written = {target for address, target in self.write_targets.items()
+                        if address not in self.dynamic_writes}
+
+    def arguments(self):
+        """ Addresses of all the instruction arguments.  Instructions are only ever
+            added so the set is rebuilt only when there are new ones.
+        """
+        count, arguments = self.argument_cache
+        if count != len(self.instructions):
+            arguments = {address + offset for address, (_, _, size) in self.instructions.items()
+                         for offset in range(1, size)}
+            self.argument_cache = (len(self.instructions), arguments)
+        return arguments
+
+    def classify(self, address):
+        """ OP_CODE, ARGUMENT or DATA for the given address """
+        if address in self.instructions:
+            return OP_CODE
+        if address in self.arguments():
+            return ARGUMENT
+        return DATA
+
+    @property
+    def patched_op_codes(self):
+        """ Op-code addresses the program writes to.  Includes addresses we reached
+            that are not valid until the program patches them.
+        """
+        return self.written & (set(self.instructions) | self.invalid)
+
+    @property
+    def patched_args(self):
+        """ Argument addresses the program writes to """
+        return self.written & self.arguments()
+
+    @property
+    def self_modifying(self):
+        """ True if the program writes over any of its code """
+        return bool(self.patched_op_codes or self.patched_args)
+
+    def blocks(self):
+        """ Basic blocks.  key = start address, val = list of instruction addresses.
+            A block starts at an entry, a jump target or after a jump or halt.
+        """
+        leaders = self.entries | self.jump_targets
+        blocks = {}
+        block = None
+        for address in sorted(self.instructions):
+            op_code = self.instructions[address][0]
+            if block is None or address in leaders or block[-1] + self.instructions[
+                    block[-1]][2] != address:
+                block = blocks.setdefault(address, [])
+            block.append(address)
+            if op_code in (5, 6, 99):
+                block = None
+        return blocks
+
+    def format_instruction(self, address):
+        """ Text for the instruction at address e.g. 'add [100], 1 -> [rb+3]' """
+        op_code, modes, size = self.instructions[address]
+        args = []
+        for offset, mode in enumerate(modes, 1):
+            word = self.memory.get(address + offset, 0)
+            if mode == icc.I_MODE:
+                args.append(str(word))
+            elif mode == icc.P_MODE:
+                args.append(f'[{word}]')
+            else:
+                args.append(f'[rb{word:+}]')
+
+        if op_code in WRITE_OP_CODES and size > 2:
+            return f"{MNEMONICS[op_code]} {', '.join(args[:-1])} -> {args[-1]}"
+        return f"{MNEMONICS[op_code]} {', '.join(args)}".strip()
+
+    def listing(self):
+        """ Disassembly listing.  Data is shown 8 values to a line. """
+        end = self.size
+        if end is None:
+            end = max((address + size for address, (_, _, size) in self.instructions.items()),
+                      default=0)
+
+        arguments = self.arguments()
+        leaders = set(self.blocks())
+        lines = []
+        data = []
+        address = 0
+        while address < end:
+            if address in self.instructions:
+                if data:
+                    lines.append(f"{data[0][0]:>6}: data {', '.join(str(v) for _, v in data)}")
+                    data = []
+                if address in leaders:
+                    lines.append(f'{address}:')
+                flag = ' *' if address in self.written else ''
+                lines.append(f'{address:>6}: {self.format_instruction(address)}{flag}')
+                address += self.instructions[address][2]
+                continue
+
+            if address not in arguments:
+                data.append((address, self.memory.get(address, 0)))
+                if len(data) == 8:
+                    lines.append(f"{data[0][0]:>6}: data {', '.join(str(v) for _, v in data)}")
+                    data = []
+            address += 1
+
+        if data:
+            lines.append(f"{data[0][0]:>6}: data {', '.join(str(v) for _, v in data)}")
+        return '\n'.join(lines)
+
+def analyse(program, entries=(0,)):
+    """ Statically analyse a program.  program is a list (the image) or a memory
+        object from int_code_computer.  Returns a Disassembly.
+    """
+    if isinstance(program, list):
+        memory, size = icc.DictMemory(program), len(program)
+    else:
+        memory, size = program, None
+
+    variable = set()
+    while True:
+        disassembly = Disassembly(memory, size, variable)
+        for entry in entries:
+            disassembly.walk(entry)
+
+        # Follow stored return addresses until we stop finding new code
+        while disassembly.indirect_jumps:
+            pointers = disassembly.code_pointers()
+            if not pointers:
+                break
+            for entry in pointers:
+                disassembly.walk(entry)
+
+        disassembly.finish()
+        written = disassembly.written | variable
+        if written == variable:
+            return disassembly
+        variable = written
+
+def run_tests():
+    """ Check the analysis against what the programs actually do """
+
+    # Self modifying.  Writes over the op-code at address 0.
+    disassembly = analyse(icc.TEST_7)
+    assert disassembly.patched_op_codes == {0}
+    assert disassembly.classify(1) == ARGUMENT and disassembly.classify(100) == DATA
+
+    disassembly = analyse(icc.TEST_4)
+    assert not disassembly.self_modifying
+    assert [disassembly.classify(address) for address in range(4)] == [
+        OP_CODE, ARGUMENT, OP_CODE, ARGUMENT]
+    assert disassembly.jump_targets == {0}
+    assert disassembly.classify(16) == DATA
+
+    # Day 5 fixes up the op-code at address 6 before it runs it
+    assert analyse(icc.load_data('day_05_data.txt')).patched_op_codes == {6}
+
+    # Every instruction the machine executes should be found statically
+    for filename, input_data in [('day_09_data.txt', [1]),
+                                 ('day_11_data.txt', None),
+                                 ('day_13_data.txt', None),
+                                 ('day_17_data.txt', None),
+                                 ('day_19_data.txt', [10, 12])]:
+        program = icc.load_data(filename)
+        disassembly = analyse(program)
+
+        executed = set()
+        comp = icc.IntCodeComputer(program, input_data)
+        comp.add_hook(lambda address, _: executed.add(address))
+        comp.run_until_input()
+        assert executed <= set(disassembly.instructions), filename
+        assert not disassembly.patched_op_codes, filename
+
+    # Day 9 leaves its code alone.  Day 13 patches instruction args to index its arrays.
+    assert not analyse(icc.load_data('day_09_data.txt')).self_modifying
+    assert analyse(icc.load_data('day_13_data.txt')).patched_args
+
+    LOGGER.info('Int code disassembler: all tests pass')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_tests()
@@ -0,0 +1,139 @@
+'''
+Advent of Code 2019
+
+Binary program images for the int code computer
+
+Saves a program as fixed width words so loading it is one memory copy rather than
+parsing the comma separated text.  load_image() memory maps the file.
+
+Image format (little endian):
+
+    header: b'ICIM', version byte, 3 pad bytes, word count (u64), escape count (u64)
+    words:  one signed 64 bit int per address
+    escapes: for each value that does not fit in 64 bits (the word holds ESCAPE)
+             address (u64), byte count (u32), value as signed little endian bytes
+
+int_code_computer.load_data('x.txt', use_image=True) uses x.icim instead if there is
+one that is newer than the text file.  Without use_image the text is always read.
+
+Usage: python int_code_image.py day_09_data.txt ...     Write day_09_data.icim etc.
+
+'''
+
+import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+import int_code_computer as icc
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'ICIM'
+VERSION = 1
+IMAGE_SUFFIX = '.icim'
+
+HEADER = struct.Struct('<4sB3xQQ')
+ESCAPE_HEADER = struct.Struct('<QI')
+
+# Word value that says the real value is in the escape table
+ESCAPE = -(1 << 63)
+WORD_MAX = (1 << 63) - 1
+
+def image_filename(filename):
+    """ Image file name for a text program file """
+    return os.path.splitext(filename)[0] + IMAGE_SUFFIX
+
+def save_image(program, filename):
+    """ Write the program to filename in the image format """
+    program = list(program)
+    escapes = [(address, value) for address, value in enumerate(program)
+               if not ESCAPE < value <= WORD_MAX]
+    words = list(program)
+    for address, _ in escapes:
+        words[address] = ESCAPE
+
+    words = array.array('q', words)
+    if sys.byteorder == 'big':
+        words.byteswap()
+
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(words), len(escapes)))
+        file.write(words.tobytes())
+        for address, value in escapes:
+            data = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+            file.write(ESCAPE_HEADER.pack(address, len(data)))
+            file.write(data)
+
+def load_image(filename):
+    """ Memory map an image file and return the program as a list """
+    with open(filename, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            magic, version, count, escape_count = HEADER.unpack_from(image, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{filename} is not an int code image')
+
+            index = HEADER.size + 8 * count
+            words = array.array('q')
+            words.frombytes(image[HEADER.size:index])
+            if sys.byteorder == 'big':
+                words.byteswap()
+            program = words.tolist()
+
+            for _ in range(escape_count):
+                address, length = ESCAPE_HEADER.unpack_from(image, index)
+                index += ESCAPE_HEADER.size
+                program[address] = int.from_bytes(image[index:index + length], 'little',
+                                                  signed=True)
+                index += length
+
+    return program
+
+def find_image(filename):
+    """ Image file for the text file if there is one that is up to date else None """
+    image = image_filename(filename)
+    try:
+        if os.path.getmtime(image) >= os.path.getmtime(filename):
+            return image
+    except OSError:
+        pass
+    return None
+
+def run_tests():
+    """ Round trip programs through images """
+    big = [1 << 63, -(1 << 63), (1 << 63) - 1, -(1 << 200), 12345678901234567890123]
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.icim')
+        for program in [[], icc.TEST_5, icc.TEST_6, big + icc.TEST_4,
+                        icc.load_data('day_09_data.txt')]:
+            save_image(program, filename)
+            assert load_image(filename) == program
+
+        # load_data only uses the image when asked to and it is newer than the text
+        text = os.path.join(directory, 'prog.txt')
+        with open(text, 'w') as file:
+            file.write(','.join(str(value) for value in icc.TEST_3))
+        assert find_image(text) is None
+        save_image(big, image_filename(text))
+        assert icc.load_data(text) == icc.TEST_3
+        assert icc.load_data(text, use_image=True) == big
+        os.utime(image_filename(text), (0, 0))
+        assert icc.load_data(text, use_image=True) == icc.TEST_3
+
+    LOGGER.info('Int code image: all tests pass')
+
+def main():
+    """ Write an image for each text program file given on the command line """
+    for filename in sys.argv[1:]:
+        save_image(icc.load_data(filename), image_filename(filename))
+        print(f'{filename} -> {image_filename(filename)}')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1:
+        main()
+    else:
+        run_tests()
@@ -0,0 +1,211 @@
+'''
+Advent of Code 2019
+
+Record and replay int code computer I/O
+
+A TraceRecorder attached to a machine (comp.trace = TraceRecorder()) records every
+input consumed and output produced together with the machine instruction_count at
+that point.
+
+Trace format (all little endian varints, values zig-zag encoded so negative and
+very large numbers work):
+
+    b'ICTR' + version byte
+    then for each event:
+        event type byte (0 = input, 1 = output)
+        instructions since the previous event
+        value
+
+TraceReplay reads a trace back.  outputs() gives the outputs of the session up to any
+event without running anything.  resume() rebuilds a live machine at a given event
+by feeding the recorded inputs back in and checks it does the same thing as before.
+
+'''
+
+import logging
+
+import int_code_computer as icc
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'ICTR'
+VERSION = 1
+
+INPUT_EVENT = 0
+OUTPUT_EVENT = 1
+
+def encode_varint(value, data):
+    """ Append an unsigned int to data 7 bits per byte, low bits first """
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return
+
+def decode_varint(data, index):
+    """ Read an unsigned int from data at index.  Returns (value, next index) """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, index
+
+def zigzag(value):
+    """ Map signed ints onto unsigned ones 0, -1, 1, -2 ... -> 0, 1, 2, 3 ... """
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+def unzigzag(value):
+    """ Reverse of zigzag() """
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+class TraceRecorder():
+    """ Records the I/O events of a machine in the binary trace format """
+    def __init__(self):
+        self.data = bytearray(MAGIC)
+        self.data.append(VERSION)
+        self.events = 0
+        self.last_count = 0
+
+    def record(self, event, instruction_count, value):
+        """ Add an event to the trace """
+        self.data.append(event)
+        encode_varint(instruction_count - self.last_count, self.data)
+        encode_varint(zigzag(value), self.data)
+        self.last_count = instruction_count
+        self.events += 1
+
+    def input(self, instruction_count, value):
+        """ Machine has consumed an input value """
+        self.record(INPUT_EVENT, instruction_count, value)
+
+    def output(self, instruction_count, value):
+        """ Machine has produced an output value """
+        self.record(OUTPUT_EVENT, instruction_count, value)
+
+    def save(self, filename):
+        """ Write the trace to a file """
+        with open(filename, 'wb') as file:
+            file.write(self.data)
+
+class TraceReplay():
+    """ Replay a recorded trace """
+    def __init__(self, data):
+        data = bytes(data)
+        if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != VERSION:
+            raise ValueError('Not an int code trace')
+
+        # List of (event type, instruction count, value)
+        self.events = []
+        count = 0
+        index = len(MAGIC) + 1
+        while index < len(data):
+            event = data[index]
+            delta, index = decode_varint(data, index + 1)
+            value, index = decode_varint(data, index)
+            count += delta
+            self.events.append((event, count, unzigzag(value)))
+
+    @classmethod
+    def load(cls, filename):
+        """ Read a trace from a file """
+        with open(filename, 'rb') as file:
+            return cls(file.read())
+
+    def inputs(self, until=None):
+        """ Input values consumed before event number 'until' (all if None) """
+        return [value for event, _, value in self.events[:until] if event == INPUT_EVENT]
+
+    def outputs(self, until=None):
+        """ Output values produced before event number 'until' (all if None) """
+        return [value for event, _, value in self.events[:until] if event == OUTPUT_EVENT]
+
+    def resume(self, program, until=None, **kwargs):
+        """ Build a machine for program and run it to just after event number 'until'
+            (the end of the trace if None) feeding it the recorded inputs.
+            kwargs are passed to IntCodeComputer (e.g. compiled=True).
+
+            Outputs are checked as they reach the output queue, or the result list
+            for OUTPUT_LIST and ring sinks.  A callable output_sink can not be
+            checked so raises ValueError, as does the machine doing something
+            different to the trace.
+        """
+        output_sink = kwargs.get('output_sink', icc.OUTPUT_BOTH)
+        if callable(output_sink):
+            raise ValueError('Can not replay a trace into a callable output sink')
+
+        comp = icc.IntCodeComputer(program, **kwargs)
+        if output_sink in (icc.OUTPUT_BOTH, icc.OUTPUT_QUEUE):
+            last_output = comp.output.get
+        else:
+            def last_output():
+                return comp.result[-1]
+
+        for event, count, value in self.events[:until]:
+            status = comp.step_until_io()
+
+            if event == INPUT_EVENT:
+                if status != icc.NEED_INPUT:
+                    raise ValueError(f'Expected input request at {count} got {status}')
+                comp.input.put(value)
+                comp.process_instruction()
+
+            elif status != icc.OUTPUT_READY or last_output() != value:
+                raise ValueError(f'Expected output {value} at {count} got {status}')
+
+            if comp.instruction_count != count:
+                raise ValueError(f'Event at {comp.instruction_count} in replay but '
+                                 f'{count} in trace')
+
+        return comp
+
+def run_tests():
+    """ Record and replay a day 11 painting session """
+    import day_11_space_police as day_11 # pylint: disable=import-outside-toplevel
+
+    for value in [0, 1, -1, 63, -64, 64, 1125899906842624, -(1 << 80)]:
+        data = bytearray()
+        encode_varint(zigzag(value), data)
+        assert unzigzag(decode_varint(data, 0)[0]) == value
+
+    program = icc.load_data('day_11_data.txt')
+    comp = icc.IntCodeComputer(program, [1])
+    comp.trace = TraceRecorder()
+    day_11.paint_sign(program, comp)
+
+    replay = TraceReplay(comp.trace.data)
+    assert len(replay.events) == comp.trace.events
+    assert replay.outputs() == comp.result
+    assert replay.events[-1][1] <= comp.instruction_count
+
+    # Pick up the session part way through and check it finishes the same way
+    resumed = replay.resume(program, until=101, compiled=True)
+    assert resumed.result == replay.outputs(101)
+    for value in replay.inputs()[len(replay.inputs(101)):]:
+        resumed.input.put(value)
+    resumed.run_until_input()
+    assert resumed.result == comp.result
+    assert resumed.instruction_count == comp.instruction_count
+
+    # Sinks without a queue are checked through the result list
+    for output_sink in (icc.OUTPUT_LIST, 2):
+        resumed = replay.resume(program, until=101, output_sink=output_sink)
+        assert list(resumed.result) == replay.outputs(101)[-len(resumed.result):]
+        assert resumed.output.empty()
+    try:
+        replay.resume(program, until=101, output_sink=[].append)
+        assert False, 'Expected ValueError for a callable output sink'
+    except ValueError:
+        pass
+
+    LOGGER.info('Int code trace: all tests pass')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_tests()
@@ -0,0 +1,259 @@
+'''
+Advent of Code 2019
+
+Lockstep int code computer for running one program against many inputs
+
+A VectorComputer runs the same program once per input vector (a lane) with all the
+lanes held in NumPy arrays: memory is shaped (lanes, addresses) and the instruction
+pointer, relative base and input position are one value per lane.  Each step the
+live lanes are grouped by instruction pointer (and op-code word, in case a lane has
+patched its code) and every group runs its instruction as array operations.  While
+the lanes agree on where they are in the program that is one group, so one decode
+and a handful of array ops run the instruction for every lane.
+
+Lanes split apart at data dependent jumps.  We always step the group that is
+furthest behind (fewest instructions retired) so lanes that took the short side of
+a branch wait at the join for the others and carry on together.
+
+Edge cases match IntCodeComputer: a lane halts on an unknown op-code or when its
+instruction pointer leaves the memory it has used (the words there are all zero),
+and negative data addresses work (memory grows to the left, offset columns).
+
+Values are int64, not Python ints, so programs that overflow 64 bits give wrong
+answers.  The puzzle programs we batch (e.g. day 19) stay well inside that.
+
+NumPy is optional.  Without it run_lockstep() falls back to
+int_code_computer.run_batch().
+
+Usage: run_lockstep(program, [(x, y) for y in range(50) for x in range(50)])
+
+'''
+
+import logging
+
+import int_code_computer as icc
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOGGER = logging.getLogger(__name__)
+
+class VectorComputer():
+    """ One program run in lockstep for each of the input vectors """
+    def __init__(self, program, input_vectors):
+        if np is None:
+            raise ImportError('VectorComputer needs numpy')
+
+        input_vectors = [list(input_data or []) for input_data in input_vectors]
+        lanes = len(input_vectors)
+        width = max((len(input_data) for input_data in input_vectors), default=0)
+
+        # key = (lane, address + offset).  Extra columns are headroom and grow on
+        # demand, to the left for negative addresses.
+        self.memory = np.zeros((lanes, len(program) + icc.DENSE_HEADROOM), dtype=np.int64)
+        self.memory[:, :len(program)] = program
+        self.offset = 0
+
+        self.inputs = np.zeros((lanes, max(width, 1)), dtype=np.int64)
+        self.input_size = np.zeros(lanes, dtype=np.int64)
+        for lane, input_data in enumerate(input_vectors):
+            self.inputs[lane, :len(input_data)] = input_data
+            self.input_size[lane] = len(input_data)
+
+        self.instruction_pointer = np.zeros(lanes, dtype=np.int64)
+        self.relative_base = np.zeros(lanes, dtype=np.int64)
+        self.input_position = np.zeros(lanes, dtype=np.int64)
+        self.instruction_count = np.zeros(lanes, dtype=np.int64)
+        self.halted = np.zeros(lanes, dtype=bool)
+        self.results = [[] for _ in range(lanes)]
+
+        # Groups of lanes stepped (one decode + dispatch each)
+        self.dispatches = 0
+
+    def grow(self, addresses):
+        """ Make sure the memory has columns for all the given addresses """
+        if addresses.size == 0:
+            return
+        before = -(int(addresses.min()) + self.offset)
+        if before > 0:
+            extra = before + icc.DENSE_HEADROOM
+            self.memory = np.pad(self.memory, ((0, 0), (extra, 0)))
+            self.offset += extra
+        needed = int(addresses.max()) + self.offset + 1
+        if needed > self.memory.shape[1]:
+            extra = needed - self.memory.shape[1] + icc.DENSE_HEADROOM
+            self.memory = np.pad(self.memory, ((0, 0), (0, extra)))
+
+    def address(self, lanes, address, mode):
+        """ Address per lane that the argument at address refers to """
+        word = self.memory[lanes, address + self.offset]
+        if mode == icc.P_MODE:
+            addresses = word
+        elif mode == icc.R_MODE:
+            addresses = self.relative_base[lanes] + word
+        else:
+            raise ValueError(f'Bad write mode {mode}')
+        self.grow(addresses)
+        return addresses
+
+    def read(self, lanes, address, mode):
+        """ Value per lane of the argument at address """
+        if mode == icc.I_MODE:
+            return self.memory[lanes, address + self.offset]
+        addresses = self.address(lanes, address, mode)
+        return self.memory[lanes, addresses + self.offset]
+
+    def write(self, lanes, address, mode, values):
+        """ Write values to the result address of the argument at address """
+        addresses = self.address(lanes, address, mode)
+        self.memory[lanes, addresses + self.offset] = values
+
+    def execute(self, lanes, address):
+        """ Run the instruction at address for the given lanes """
+        column = address + self.offset
+        if 0 <= column < self.memory.shape[1]:
+            words = self.memory[lanes, column]
+        else:
+            # Nothing has been written out here so the op-code is 0
+            words = np.zeros(lanes.size, dtype=np.int64)
+        value = int(words[0])
+        if (words != value).any():
+            # The lanes have different code here.  Run each variant on its own.
+            for word in np.unique(words):
+                self.execute(lanes[words == word], address)
+            return
+
+        self.dispatches += 1
+        self.instruction_count[lanes] += 1
+        op_code, mode_1, mode_2, mode_3, size = icc.decode_op_code(value)
+        if op_code is None:
+            # Unknown op-code.  Halt as IntCodeComputer does.
+            self.halted[lanes] = True
+            return
+
+        self.grow(np.array([address + size]))
+        next_address = address + size
+
+        if op_code in (1, 2, 7, 8):
+            arg1 = self.read(lanes, address + 1, mode_1)
+            arg2 = self.read(lanes, address + 2, mode_2)
+            if op_code == 1:
+                values = arg1 + arg2
+            elif op_code == 2:
+                values = arg1 * arg2
+            elif op_code == 7:
+                values = (arg1 < arg2).astype(np.int64)
+            else:
+                values = (arg1 == arg2).astype(np.int64)
+            self.write(lanes, address + 3, mode_3, values)
+
+        elif op_code == 3:
+            positions = self.input_position[lanes]
+            if (positions >= self.input_size[lanes]).any():
+                raise ValueError('Program wants more input than it was given')
+            self.write(lanes, address + 1, mode_1, self.inputs[lanes, positions])
+            self.input_position[lanes] += 1
+
+        elif op_code == 4:
+            for lane, value in zip(lanes.tolist(),
+                                   self.read(lanes, address + 1, mode_1).tolist()):
+                self.results[lane].append(value)
+
+        elif op_code in (5, 6):
+            condition = self.read(lanes, address + 1, mode_1) != 0
+            if op_code == 6:
+                condition = ~condition
+            targets = self.read(lanes, address + 2, mode_2)
+            self.instruction_pointer[lanes] = np.where(condition, targets, next_address)
+            return
+
+        elif op_code == 9:
+            self.relative_base[lanes] += self.read(lanes, address + 1, mode_1)
+
+        elif op_code == 99:
+            self.halted[lanes] = True
+            return
+
+        self.instruction_pointer[lanes] = next_address
+
+    def step(self, live):
+        """ Step the lanes that are furthest behind.  live = lanes still running. """
+        pointers = self.instruction_pointer[live]
+        address = int(pointers[0])
+        if (pointers == address).all():
+            self.execute(live, address)
+            return
+
+        counts = self.instruction_count[live]
+        address = int(pointers[counts.argmin()])
+        self.execute(live[pointers == address], address)
+
+    def run(self):
+        """ Run every lane until it halts.  Returns the list of outputs per lane. """
+        live = np.flatnonzero(~self.halted)
+        while live.size:
+            self.step(live)
+            live = live[~self.halted[live]]
+        return self.results
+
+def run_lockstep(program, input_vectors):
+    """ Run the program once for each input vector.  Returns the list of outputs
+        for each run in the same order as input_vectors.
+    """
+    if np is None:
+        return icc.run_batch(program, input_vectors)
+    return VectorComputer(program, input_vectors).run()
+
+def run_tests():
+    """ Compare lockstep runs with the normal computer.  Returns False if the tests
+        were skipped because numpy is not installed.
+    """
+    if np is None:
+        LOGGER.warning('Int code vector: SKIPPED, numpy is not installed')
+        return False
+
+    tests = [(icc.TEST_1, [[0], [1], [5]]),
+             (icc.TEST_2, [[0], [1], [-3]]),
+             (icc.TEST_3, [[7], [8], [9], [-8]]),
+             (icc.TEST_4, [[]]),
+             (icc.TEST_5, [[], []]),
+             (icc.TEST_7, [[]]),
+             (icc.load_data('day_05_data.txt'), [[icc.AC_UNIT_ID], [icc.TRC_UNIT_ID]]),
+             (icc.load_data('day_09_data.txt'), [[1]]),
+             (icc.load_data('day_19_data.txt'), [[x, y] for y in range(20) for x in range(20)]),
+             # Jumps past the image, to a negative address and to data (op-code 0)
+             ([1105, 1, 5000], [[]]),
+             ([1105, 1, -1], [[]]),
+             ([3, 4, 1105, 1, 0], [[5000], [-2], [5]]),
+             # Unknown op-codes
+             ([98, 0, 0], [[]]),
+             ([3, 5, 1005, 5, 7, 99, 0, 42, 99], [[0], [1]]),
+             # Negative data addresses, absolute and relative
+             ([1101, 5, 6, -3, 4, -3, 99], [[]]),
+             ([109, -10, 21101, 2, 3, 0, 204, 0, 109, -5000, 203, 0, 4, -5000, 99], [[9]])]
+
+    for program, input_vectors in tests:
+        comp = VectorComputer(program, input_vectors)
+        results = comp.run()
+        for lane, input_data in enumerate(input_vectors):
+            scalar = icc.IntCodeComputer(program, input_data)
+            scalar.run_program()
+            assert results[lane] == scalar.result
+            assert comp.instruction_count[lane] == scalar.instruction_count
+            assert comp.instruction_pointer[lane] == scalar.instruction_pointer
+
+    # Lanes that branch apart join up again so there are far fewer dispatches
+    # than instructions
+    comp = VectorComputer(icc.load_data('day_19_data.txt'),
+                          [[x, y] for y in range(50) for x in range(50)])
+    assert sum(result[0] for result in comp.run()) == 201
+    assert comp.dispatches * 100 < comp.instruction_count.sum()
+
+    LOGGER.info('Int code vector: all tests pass')
+    return True
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_tests()